@@ -1,14 +1,138 @@
+import argparse as argparse
+import contextlib as contextlib
+import itertools as itertools
 import json as json
+import os as os
 import sys as sys
+import traceback as traceback
 
-from .lib import debug, load_json
-from .flatten_references_graph import flatten_references_graph
+# Modules importing igraph or toolz (most of them) are imported only when
+# needed, so that startup is fast when they are not (e.g. on cache hits, or
+# when the work is done by the daemon). Only modules which don't import them
+# are imported here (see __main___test.py).
+from .binary_format import convert_json_to_binary, is_binary_file
+from .cache import (
+    DEFAULT_MAX_SIZE,
+    ResultCache,
+    graph_hasher,
+    hashing_nodes,
+    result_key
+)
+from .daemon_client import DaemonError, send_request
+from .json_output import format_result, write_result
+from .json_stream import iter_object_items
+from .util import debug, load_json
 
 
-def main_impl(file_path):
-    debug(f"loading json from {file_path}")
+def load_json_streaming(file_path):
+    """Load input of main_impl, parsing nodes of the graph one by one and
+    converting them straight into an igraph graph (see
+    references_graph_to_igraph for memory usage).
+    """
+    from .lib import references_graph_to_igraph
 
-    data = load_json(file_path)
+    with open(file_path) as f:
+        return {
+            key: (
+                references_graph_to_igraph(value) if key == "graph"
+                else value
+            )
+            for (key, value) in iter_object_items(f, streamed_keys=["graph"])
+        }
+
+
+def hash_json_streaming(file_path, hasher, sizes=None):
+    """Load input of main_impl, like load_json_streaming, but only hash the
+    nodes of the graph (see cache.hashing_nodes) instead of building the
+    graph, which is loaded as None.
+
+    If sizes (a dict) is given, narSize of every path is stored in it.
+    """
+    with open(file_path) as f:
+        data = {}
+        for (key, value) in iter_object_items(f, streamed_keys=["graph"]):
+            if key == "graph":
+                for node in hashing_nodes(hasher, value):
+                    if sizes is not None:
+                        sizes[node["path"]] = node.get("narSize")
+                value = None
+            data[key] = value
+
+        return data
+
+
+def load_previous(previous):
+    """Return incremental.Relayering with the state after a previous run
+    (see Relayering.from_previous), given as paths of its input file and of
+    its result.
+    """
+    from .incremental import Relayering
+
+    (previous_file_path, previous_result_path) = previous
+
+    if is_binary_file(previous_file_path):
+        from .binary_format import load_binary
+
+        data = load_binary(previous_file_path)
+    else:
+        data = load_json(previous_file_path)
+
+    return Relayering.from_previous(
+        data["graph"],
+        data["pipeline"],
+        load_json(previous_result_path),
+        exclude_paths=data.get("exclude_paths")
+    )
+
+
+def main_impl(
+    file_path,
+    stream=False,
+    cache=None,
+    executor=None,
+    output=None,
+    compact=False,
+    previous=None,
+    with_sizes=False
+):
+    """Process input file (JSON, or in the binary format, see
+    binary_format.py) and return formatted result (see
+    json_output.format_result).
+
+    If output (a text file) is given, the result is written to it instead
+    (incrementally, unless it's taken from or stored in the cache), and None
+    is returned.
+
+    If previous (paths of a previous input file and of its result) is given,
+    the result is computed incrementally from the previous one (see
+    load_previous).
+
+    If with_sizes is True, a pair of the above and narSize of every path of
+    the graph (see stability.nar_sizes) is returned.
+    """
+    debug(f"loading input from {file_path}")
+
+    hasher = graph_hasher()
+    binary = is_binary_file(file_path)
+    # narSize of every path, if it's collected while the input is loaded.
+    sizes = None
+
+    if binary:
+        from .binary_format import load_binary
+
+        data = load_binary(
+            file_path,
+            hasher=hasher if cache is not None else None
+        )
+    elif stream and cache is not None:
+        # The graph is only built on cache misses (parsing the file again,
+        # see below), so that cache hits don't pay for building it.
+        sizes = {} if with_sizes else None
+        data = hash_json_streaming(file_path, hasher, sizes)
+    elif stream:
+        data = load_json_streaming(file_path)
+    else:
+        data = load_json(file_path)
 
     # These are required
     references_graph = data["graph"]
@@ -21,27 +145,579 @@ def main_impl(file_path):
     debug("pipeline", pipeline)
     debug("exclude_paths", exclude_paths)
 
+    def returned(value):
+        if not with_sizes:
+            return value
+
+        from .stability import nar_sizes
+
+        return (
+            value,
+            nar_sizes(references_graph) if sizes is None else sizes
+        )
+
+    if cache is not None:
+        # Graph is hashed while it's loaded in other modes.
+        if not (stream or binary):
+            for _ in hashing_nodes(hasher, references_graph):
+                pass
+
+        key = result_key(hasher, pipeline, exclude_paths, compact=compact)
+        cached = cache.get(key)
+
+        if cached is not None:
+            debug("cache hit", key)
+            return returned(emit_text(output, cached))
+
+        debug("cache miss", key)
+
+        if stream and not binary:
+            references_graph = load_json_streaming(file_path)["graph"]
+
+    from .flatten_references_graph import flatten_references_graph
+
     result = flatten_references_graph(
         references_graph,
         pipeline,
-        exclude_paths=exclude_paths
+        exclude_paths=exclude_paths,
+        executor=executor,
+        previous=None if previous is None else load_previous(previous)
     )
 
+    if cache is not None:
+        text = format_result(result, compact)
+        cache.put(key, text)
+        return returned(emit_text(output, text))
+
+    return returned(emit_result(output, result, compact))
+
+
+def emit_text(output, text):
+    if output is None:
+        return text
+
+    output.write(text)
+
+
+def emit_result(output, result, compact):
     debug("result", result)
 
-    return json.dumps(
-        result,
-        # For reproducibility.
-        sort_keys=True,
-        indent=2,
-        # Avoid training whitespaces.
-        separators=(",", ": ")
+    if output is None:
+        return format_result(result, compact)
+
+    write_result(output, result, compact)
+
+
+def main_batch_impl(file_path, executor=None, output=None, compact=False):
+    """Like main_impl, but for a file with a list of jobs (see
+    flatten_references_graph_batch) under "jobs" key, and an optional
+    "graph", shared by the jobs. The result is a list of results of all
+    jobs.
+    """
+    debug(f"loading json from {file_path}")
+
+    from .batch import flatten_references_graph_batch
+
+    data = load_json(file_path)
+
+    return emit_result(
+        output,
+        flatten_references_graph_batch(
+            data["jobs"],
+            graph=data.get("graph"),
+            executor=executor
+        ),
+        compact
+    )
+
+
+def load_nar_sizes(file_path):
+    """Return narSize of every path of the graph of the input file (see
+    stability.nar_sizes).
+    """
+    from .stability import nar_sizes
+
+    if is_binary_file(file_path):
+        from .binary_format import load_binary
+
+        return nar_sizes(load_binary(file_path)["graph"])
+
+    return nar_sizes(load_json(file_path)["graph"])
+
+
+def report_reuse(previous_result_path, sizes, text):
+    """Print (to stderr) how many layers (and bytes) of the result (text)
+    are the same as in the previous result, and so can be reused (see
+    stability.py), given narSize of every path (see stability.nar_sizes).
+    """
+    from .stability import layer_reuse
+
+    reuse = layer_reuse(
+        load_json(previous_result_path),
+        json.loads(text),
+        sizes
     )
 
+    print(
+        f"Reused {reuse['reused_layers']} of {reuse['layers']} layers "
+        f"({reuse['reused_bytes']} of {reuse['bytes']} bytes)",
+        file=sys.stderr
+    )
+
+
+OUTPUT_SUFFIX = ".layers.json"
+
+BRANCH_EXECUTOR_KINDS = ["process", "thread"]
+
+
+def branch_executor(options):
+    """Return executor for independent branches of pipelines (see pipe.pipe)
+    given (kind, max_workers) options, or a context with None if options are
+    None.
+    """
+    if options is None:
+        return contextlib.nullcontext()
+
+    import concurrent.futures as futures
+
+    (kind, max_workers) = options
+    executor_class = {
+        "thread": futures.ThreadPoolExecutor,
+        "process": futures.ProcessPoolExecutor
+    }[kind]
+
+    return executor_class(max_workers=max_workers)
+
+
+def collect_inputs(paths, manifest=None):
+    """Return list of input files given as paths (files or directories, in
+    which case all .json files in them are used, in sorted order) and in the
+    manifest (file with a path per line, relative to the manifest).
+    """
+    if manifest is not None:
+        with open(manifest) as f:
+            paths = list(paths) + [
+                os.path.join(os.path.dirname(manifest), line.strip())
+                for line in f
+                if line.strip() != ""
+            ]
+
+    return list(itertools.chain.from_iterable(map(
+        lambda path: (
+            [
+                os.path.join(path, name)
+                for name in sorted(os.listdir(path))
+                if name.endswith(".json")
+            ]
+            if os.path.isdir(path) else [path]
+        ),
+        paths
+    )))
+
+
+def output_path(output_dir, file_path):
+    name = os.path.basename(file_path)
+    if name.endswith(".json"):
+        name = name[:-len(".json")]
+
+    return os.path.join(output_dir, name + OUTPUT_SUFFIX)
+
+
+def run_input(
+    file_path,
+    output_file_path,
+    batch,
+    stream,
+    cache_options,
+    executor_options,
+    compact=False
+):
+    """Process a single input file, writing the result to output_file_path.
+    Returns None on success, or description of the error.
+
+    Runs in worker processes of run_inputs, so all arguments are plain
+    values.
+    """
+    # Result is written incrementally, so it's written to a temporary file
+    # first, to never leave partial results behind.
+    temp_file_path = output_file_path + ".tmp"
+
+    try:
+        cache = None if cache_options is None else ResultCache(*cache_options)
+
+        with branch_executor(executor_options) as executor, \
+                open(temp_file_path, "w") as f:
+            if batch:
+                main_batch_impl(
+                    file_path,
+                    executor=executor,
+                    output=f,
+                    compact=compact
+                )
+            else:
+                main_impl(
+                    file_path,
+                    stream=stream,
+                    cache=cache,
+                    executor=executor,
+                    output=f,
+                    compact=compact
+                )
+            f.write("\n")
+
+        os.replace(temp_file_path, output_file_path)
+    except Exception:
+        if os.path.exists(temp_file_path):
+            os.unlink(temp_file_path)
+        return traceback.format_exc()
+
+    return None
+
+
+def run_input_in_new_process(input_args):
+    """Same as run_input, in a new process, so that the input which makes
+    the process die can be told apart from the others.
+    """
+    import concurrent.futures as futures
+    from concurrent.futures.process import BrokenProcessPool
+
+    with futures.ProcessPoolExecutor(max_workers=1) as executor:
+        try:
+            return executor.submit(run_input, *input_args).result()
+        except BrokenProcessPool:
+            return "Process processing the input terminated abruptly\n"
+
+
+def run_inputs(
+    file_paths,
+    output_dir,
+    jobs=None,
+    batch=False,
+    stream=False,
+    cache_options=None,
+    executor_options=None,
+    compact=False
+):
+    """Process input files in a pool of jobs processes (all available CPUs
+    if None), writing result of each of them to a file in output_dir (see
+    output_path).
+
+    Failure of one input doesn't stop processing of the others. Returns a
+    dict mapping failed input files to descriptions of the errors.
+    """
+    output_paths = [output_path(output_dir, path) for path in file_paths]
+
+    if len(frozenset(output_paths)) != len(output_paths):
+        raise ValueError("Input files need to have distinct names")
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    args = [
+        (
+            file_path,
+            output_file_path,
+            batch,
+            stream,
+            cache_options,
+            executor_options,
+            compact
+        )
+        for (file_path, output_file_path) in zip(file_paths, output_paths)
+    ]
+
+    if jobs == 1:
+        errors = [run_input(*input_args) for input_args in args]
+    else:
+        import concurrent.futures as futures
+        from concurrent.futures.process import BrokenProcessPool
+
+        errors = [None] * len(args)
+        crashed = []
+
+        with futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            for (index, input_args) in enumerate(args):
+                try:
+                    errors[index] = executor.submit(run_input, *input_args)
+                except BrokenProcessPool:
+                    crashed.append(index)
+
+            for (index, future) in enumerate(errors):
+                if future is not None:
+                    try:
+                        errors[index] = future.result()
+                    except BrokenProcessPool:
+                        errors[index] = None
+                        crashed.append(index)
+
+        # When a worker process dies (e.g. killed when running out of
+        # memory), all inputs not processed yet fail, so they are processed
+        # again, each in a process of its own.
+        for index in sorted(crashed):
+            errors[index] = run_input_in_new_process(args[index])
+
+    return {
+        file_path: error
+        for (file_path, error) in zip(file_paths, errors)
+        if error is not None
+    }
+
 
 def main():
-    file_path = sys.argv[1]
-    print(main_impl(file_path))
+    parser = argparse.ArgumentParser(
+        prog="flatten_references_graph",
+        description="Split a references graph into layers."
+    )
+    parser.add_argument(
+        "file_paths",
+        nargs="*",
+        metavar="file_path",
+        help="JSON file with graph, pipeline and (optional) exclude_paths, "
+        "or a directory of such files"
+    )
+    parser.add_argument(
+        "--manifest",
+        help="file with a list of input files (one per line, relative to the "
+        "manifest)"
+    )
+    parser.add_argument(
+        "--output-dir",
+        help="write result of every input file to <name>" + OUTPUT_SUFFIX +
+        " in this directory (required if there is more than one input file)"
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        help="number of inputs processed in parallel (default: number of "
+        "CPUs)"
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="output JSON without indentation"
+    )
+    parser.add_argument(
+        "--report-reuse",
+        metavar="PREVIOUS_RESULT",
+        help="print (to stderr) how many layers, and bytes, of the result "
+        "are the same as in PREVIOUS_RESULT (output of a previous run), and "
+        "so can be reused from registry caches"
+    )
+    parser.add_argument(
+        "--previous",
+        nargs=2,
+        metavar=("PREVIOUS_INPUT", "PREVIOUS_RESULT"),
+        help="compute the result incrementally from PREVIOUS_RESULT (output "
+        "of a previous run for PREVIOUS_INPUT): popularity is only "
+        "recomputed for paths affected by the changes of the graph"
+    )
+    parser.add_argument(
+        "--to-binary",
+        metavar="OUTPUT",
+        help="convert the input file to the binary format (which is detected "
+        "automatically when reading inputs), and write it to OUTPUT"
+    )
+    parser.add_argument(
+        "--serve",
+        metavar="SOCKET",
+        help="run as a daemon answering requests (in the format of input "
+        "files) on this Unix socket"
+    )
+    parser.add_argument(
+        "--max-graphs",
+        type=int,
+        help="number of graphs kept in memory by the daemon (default: 16)"
+    )
+    parser.add_argument(
+        "--connect",
+        metavar="SOCKET",
+        help="send the input file to the daemon listening on this Unix "
+        "socket, instead of processing it in this process"
+    )
+    parser.add_argument(
+        "--branch-executor",
+        choices=BRANCH_EXECUTOR_KINDS,
+        help="evaluate independent branches of pipelines (consecutive "
+        "\"over\" stages and elements of \"map\" stages) concurrently, in "
+        "a pool of threads or processes"
+    )
+    parser.add_argument(
+        "--branch-workers",
+        type=int,
+        help="size of the pool used by --branch-executor (default: depends "
+        "on the number of CPUs)"
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="the file contains a list of jobs (each with its own pipeline "
+        "and graph, or roots in a graph shared by all jobs), print a list of "
+        "results"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="parse the graph incrementally to reduce peak memory usage"
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        help="directory of a cache of results (can be shared by concurrent "
+        "processes)"
+    )
+    parser.add_argument(
+        "--cache-max-size",
+        type=int,
+        default=DEFAULT_MAX_SIZE,
+        help="size of the cache (in bytes) above which least recently used "
+        "results are removed"
+    )
+
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        from .daemon import DEFAULT_MAX_GRAPHS, serve
+
+        serve(
+            args.serve,
+            DEFAULT_MAX_GRAPHS if args.max_graphs is None
+            else args.max_graphs
+        )
+        return
+
+    cache_options = (
+        None if args.cache_dir is None
+        else (args.cache_dir, args.cache_max_size)
+    )
+
+    executor_options = (
+        None if args.branch_executor is None
+        else (args.branch_executor, args.branch_workers)
+    )
+
+    file_paths = collect_inputs(args.file_paths, args.manifest)
+
+    if len(file_paths) == 0:
+        parser.error("no input files")
+
+    if args.batch and args.stream:
+        parser.error("--batch doesn't support --stream")
+
+    if args.batch and cache_options is not None:
+        parser.error("--batch doesn't support --cache-dir")
+
+    if args.batch and args.previous is not None:
+        parser.error("--batch doesn't support --previous")
+
+    if args.output_dir is None:
+        if len(file_paths) != 1:
+            parser.error("--output-dir is required for multiple input files")
+
+        [file_path] = file_paths
+
+        if args.report_reuse is not None and args.batch:
+            parser.error("--report-reuse doesn't support --batch")
+
+        if args.previous is not None and args.connect is not None:
+            # The daemon keeps the state of previous requests itself.
+            parser.error("--previous doesn't support --connect")
+
+        if args.to_binary is not None:
+            convert_json_to_binary(file_path, args.to_binary)
+            return
+
+        if args.connect is not None:
+            try:
+                text = format_result(
+                    send_request(
+                        args.connect,
+                        {"file_path": os.path.abspath(file_path)}
+                    ),
+                    args.compact
+                )
+            except DaemonError as e:
+                sys.exit(f"Failed to process {file_path}: {e}")
+
+            print(text)
+
+            if args.report_reuse is not None:
+                # The graph is not loaded by this process otherwise.
+                report_reuse(
+                    args.report_reuse,
+                    load_nar_sizes(file_path),
+                    text
+                )
+
+            return
+
+        cache = None if cache_options is None else ResultCache(*cache_options)
+
+        with branch_executor(executor_options) as executor:
+            if args.report_reuse is not None:
+                # The result is needed for the report, so it's not written
+                # incrementally.
+                (text, sizes) = main_impl(
+                    file_path,
+                    stream=args.stream,
+                    cache=cache,
+                    executor=executor,
+                    compact=args.compact,
+                    previous=args.previous,
+                    with_sizes=True
+                )
+                print(text)
+                report_reuse(args.report_reuse, sizes, text)
+            elif args.batch:
+                main_batch_impl(
+                    file_path,
+                    executor=executor,
+                    output=sys.stdout,
+                    compact=args.compact
+                )
+            else:
+                main_impl(
+                    file_path,
+                    stream=args.stream,
+                    cache=cache,
+                    executor=executor,
+                    output=sys.stdout,
+                    compact=args.compact,
+                    previous=args.previous
+                )
+            sys.stdout.write("\n")
+
+        return
+
+    if args.connect is not None:
+        parser.error("--connect doesn't support --output-dir")
+
+    if args.previous is not None:
+        parser.error("--previous doesn't support --output-dir")
+
+    if args.report_reuse is not None:
+        parser.error("--report-reuse doesn't support --output-dir")
+
+    if args.to_binary is not None:
+        parser.error("--to-binary doesn't support --output-dir")
+
+    try:
+        errors = run_inputs(
+            file_paths,
+            args.output_dir,
+            jobs=args.jobs,
+            batch=args.batch,
+            stream=args.stream,
+            cache_options=cache_options,
+            executor_options=executor_options,
+            compact=args.compact
+        )
+    except ValueError as e:
+        parser.error(str(e))
+
+    for (file_path, error) in errors.items():
+        print(f"Failed to process {file_path}:\n{error}", file=sys.stderr)
+
+    if len(errors) > 0:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -1,13 +1,42 @@
 import unittest
+import contextlib as contextlib
 import inspect as inspect
+import io as io
+import json as json
+import os as os
+import subprocess as subprocess
+import sys as sys
+import tempfile as tempfile
 
-from .__main__ import main_impl
-from .lib import path_relative_to_file
+import unittest.mock as mock
+
+from . import __main__ as main_module
+from . import lib
+from .__main__ import (
+    collect_inputs,
+    main_batch_impl,
+    main_impl,
+    report_reuse,
+    run_input,
+    run_inputs
+)
+from .cache import ResultCache
+from .lib import load_json, path_relative_to_file
 
 if __name__ == "__main__":
     unittest.main()
 
 
+def run_input_crashing(file_path, *args):
+    """run_input, which makes the process die for inputs named crash.json
+    (a module level function, so that it can be run in worker processes).
+    """
+    if os.path.basename(file_path) == "crash.json":
+        os._exit(1)
+
+    return run_input(file_path, *args)
+
+
 class TestMain(unittest.TestCase):
 
     def test_main_impl(self):
@@ -16,23 +45,372 @@ class TestMain(unittest.TestCase):
             "__test_fixtures/flatten-references-graph-main-input.json"
         )
 
-        result = main_impl(file_path)
+        for stream in [False, True]:
+            self.assertEqual(
+                main_impl(file_path, stream=stream),
+                inspect.cleandoc(
+                    """
+                    [
+                      [
+                        "B"
+                      ],
+                      [
+                        "C"
+                      ],
+                      [
+                        "A"
+                      ]
+                    ]
+                    """
+                )
+            )
+
+    def test_main_impl_output(self):
+        file_path = path_relative_to_file(
+            __file__,
+            "__test_fixtures/flatten-references-graph-main-input.json"
+        )
+
+        for compact in [False, True]:
+            output = io.StringIO()
+
+            self.assertIsNone(
+                main_impl(file_path, output=output, compact=compact)
+            )
+            self.assertEqual(
+                output.getvalue(),
+                main_impl(file_path, compact=compact)
+            )
+
+        self.assertEqual(
+            main_impl(file_path, compact=True),
+            '[["B"],["C"],["A"]]'
+        )
+
+    def test_main_impl_stream_cache_hit(self):
+        file_path = path_relative_to_file(
+            __file__,
+            "__test_fixtures/flatten-references-graph-main-input.json"
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResultCache(directory)
+            expected = main_impl(file_path, stream=True, cache=cache)
+
+            self.assertEqual(expected, main_impl(file_path))
+
+            # The graph is not built on cache hits.
+            with mock.patch.object(
+                lib,
+                "references_graph_to_igraph",
+                side_effect=AssertionError("graph built")
+            ):
+                self.assertEqual(
+                    main_impl(file_path, stream=True, cache=cache),
+                    expected
+                )
+
+    def test_main_impl_previous(self):
+        file_path = path_relative_to_file(
+            __file__,
+            "__test_fixtures/flatten-references-graph-main-input.json"
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            previous_result_path = os.path.join(directory, "previous.json")
+            with open(previous_result_path, "w") as f:
+                f.write(main_impl(file_path))
+
+            self.assertEqual(
+                main_impl(
+                    file_path,
+                    previous=(file_path, previous_result_path)
+                ),
+                main_impl(file_path)
+            )
+
+            # The previous result is returned as is for the same input.
+            with open(previous_result_path, "w") as f:
+                json.dump([["A", "B", "C"]], f)
+
+            self.assertEqual(
+                json.loads(main_impl(
+                    file_path,
+                    previous=(file_path, previous_result_path)
+                )),
+                [["A", "B", "C"]]
+            )
+
+    def test_report_reuse(self):
+        file_path = path_relative_to_file(
+            __file__,
+            "__test_fixtures/flatten-references-graph-main-input.json"
+        )
+        sizes = {
+            node["path"]: node["narSize"]
+            for node in load_json(file_path)["graph"]
+        }
+
+        with tempfile.TemporaryDirectory() as directory:
+            previous_result_path = os.path.join(directory, "previous.json")
+            with open(previous_result_path, "w") as f:
+                json.dump([["B"], ["A", "C"]], f)
+
+            for (stream, cache) in [
+                (False, None),
+                (True, None),
+                # Graph is not built on cache hits.
+                (True, ResultCache(directory)),
+                (True, ResultCache(directory))
+            ]:
+                (text, result_sizes) = main_impl(
+                    file_path,
+                    stream=stream,
+                    cache=cache,
+                    with_sizes=True
+                )
+                self.assertEqual(text, main_impl(file_path))
+                self.assertDictEqual(result_sizes, sizes)
+
+            stderr = io.StringIO()
+            with contextlib.redirect_stderr(stderr):
+                report_reuse(previous_result_path, sizes, text)
 
         self.assertEqual(
-            result,
-            inspect.cleandoc(
-                """
+            stderr.getvalue(),
+            f"Reused 1 of 3 layers ({sizes['B']} of {sum(sizes.values())} "
+            "bytes)\n"
+        )
+
+    def test_main_batch_impl(self):
+        data = load_json(path_relative_to_file(
+            __file__,
+            "__test_fixtures/flatten-references-graph-main-input.json"
+        ))
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "batch.json")
+            with open(file_path, "w") as f:
+                json.dump(
+                    {
+                        "graph": data["graph"],
+                        "jobs": [
+                            data,
+                            {"roots": ["C"], "pipeline": data["pipeline"]}
+                        ]
+                    },
+                    f
+                )
+
+            self.assertEqual(
+                json.loads(main_batch_impl(file_path)),
+                [[["B"], ["C"], ["A"]], [["C"]]]
+            )
+
+    def test_run_inputs(self):
+        input_file_path = path_relative_to_file(
+            __file__,
+            "__test_fixtures/flatten-references-graph-main-input.json"
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            inputs_dir = os.path.join(directory, "inputs")
+            output_dir = os.path.join(directory, "outputs")
+            os.mkdir(inputs_dir)
+
+            for name in ["a.json", "b.json"]:
+                with open(os.path.join(inputs_dir, name), "w") as f:
+                    f.write(input_file_path.read_text())
+
+            with open(os.path.join(inputs_dir, "bad.json"), "w") as f:
+                f.write('{"graph": []}')
+
+            manifest = os.path.join(directory, "manifest")
+            with open(manifest, "w") as f:
+                f.write("inputs/b.json\n\ninputs/bad.json\n")
+
+            file_paths = collect_inputs([inputs_dir], manifest)
+
+            self.assertListEqual(
+                [os.path.relpath(path, directory) for path in file_paths],
                 [
-                  [
-                    "B"
-                  ],
-                  [
-                    "C"
-                  ],
-                  [
-                    "A"
-                  ]
+                    "inputs/a.json",
+                    "inputs/b.json",
+                    "inputs/bad.json",
+                    "inputs/b.json",
+                    "inputs/bad.json"
                 ]
-                """
             )
+
+            with self.assertRaises(ValueError):
+                run_inputs(file_paths, output_dir)
+
+            for jobs in [1, 2]:
+                errors = run_inputs(file_paths[:3], output_dir, jobs=jobs)
+
+                self.assertListEqual(list(errors), file_paths[2:3])
+                self.assertIn("KeyError: 'pipeline'", errors[file_paths[2]])
+                self.assertListEqual(
+                    sorted(os.listdir(output_dir)),
+                    ["a.layers.json", "b.layers.json"]
+                )
+
+                for name in ["a.layers.json", "b.layers.json"]:
+                    with open(os.path.join(output_dir, name)) as f:
+                        self.assertEqual(
+                            f.read(),
+                            main_impl(input_file_path) + "\n"
+                        )
+
+    def test_run_inputs_crash(self):
+        input_file_path = path_relative_to_file(
+            __file__,
+            "__test_fixtures/flatten-references-graph-main-input.json"
         )
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_paths = [
+                os.path.join(directory, name)
+                for name in ["a.json", "crash.json", "b.json"]
+            ]
+
+            for file_path in file_paths:
+                with open(file_path, "w") as f:
+                    f.write(input_file_path.read_text())
+
+            output_dir = os.path.join(directory, "outputs")
+
+            with mock.patch.object(
+                main_module,
+                "run_input",
+                run_input_crashing
+            ):
+                errors = run_inputs(file_paths, output_dir, jobs=2)
+
+            # Other inputs are processed, even if the worker processing them
+            # died with the one processing crash.json.
+            self.assertListEqual(list(errors), file_paths[1:2])
+            self.assertIn("terminated abruptly", errors[file_paths[1]])
+            self.assertListEqual(
+                sorted(os.listdir(output_dir)),
+                ["a.layers.json", "b.layers.json"]
+            )
+
+
+# Modules which are imported only when needed (see __main__.py), so that
+# starting the entry point is cheap.
+HEAVY_MODULES = [
+    "igraph",
+    "toolz",
+    "concurrent.futures",
+    "multiprocessing"
+]
+
+
+def run_python(code, *options):
+    return subprocess.run(
+        [sys.executable, *options, "-c", code],
+        # Directory containing the package.
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+
+def is_heavy(module):
+    return any(
+        module == heavy or module.startswith(heavy + ".")
+        for heavy in HEAVY_MODULES
+    )
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_heavy_modules_not_imported(self):
+        process = run_python(
+            "import sys\n"
+            "import flatten_references_graph.__main__\n"
+            "print(\"\\n\".join(sys.modules))"
+        )
+
+        modules = process.stdout.splitlines()
+
+        self.assertIn("flatten_references_graph.__main__", modules)
+        self.assertListEqual(
+            [module for module in modules if is_heavy(module)],
+            []
+        )
+
+    def test_cache_hit(self):
+        file_path = path_relative_to_file(
+            __file__,
+            "__test_fixtures/flatten-references-graph-main-input.json"
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            expected = main_impl(file_path, cache=ResultCache(directory))
+
+            process = run_python(
+                "\n".join([
+                    "import json, sys",
+                    "from flatten_references_graph.__main__ import main_impl",
+                    "from flatten_references_graph.cache import ResultCache",
+                    f"result = main_impl({str(file_path)!r}, "
+                    f"cache=ResultCache({directory!r}))",
+                    "print(json.dumps([result, sorted(sys.modules)]))",
+                ])
+            )
+
+        [result, modules] = json.loads(process.stdout)
+
+        self.assertEqual(result, expected)
+        self.assertListEqual(
+            [module for module in modules if is_heavy(module)],
+            []
+        )
+
+
+class TestCommandLine(unittest.TestCase):
+
+    def test_unsupported_batch_options(self):
+        file_path = path_relative_to_file(
+            __file__,
+            "__test_fixtures/flatten-references-graph-main-input.json"
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            for (options, error) in [
+                (["--stream"], "--batch doesn't support --stream"),
+                (
+                    ["--cache-dir", directory],
+                    "--batch doesn't support --cache-dir"
+                ),
+                (
+                    ["--stream", "--output-dir", directory],
+                    "--batch doesn't support --stream"
+                ),
+                (
+                    ["--previous", str(file_path), str(file_path)],
+                    "--batch doesn't support --previous"
+                ),
+            ]:
+                process = subprocess.run(
+                    [
+                        sys.executable,
+                        "-m",
+                        "flatten_references_graph",
+                        "--batch",
+                        *options,
+                        str(file_path)
+                    ],
+                    cwd=os.path.dirname(
+                        os.path.dirname(os.path.abspath(__file__))
+                    ),
+                    capture_output=True,
+                    text=True
+                )
+
+                self.assertEqual(process.returncode, 2)
+                self.assertIn(error, process.stderr)
+                self.assertEqual(process.stdout, "")
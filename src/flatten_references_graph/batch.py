@@ -0,0 +1,127 @@
+from toolz import curried as tlz
+
+from .cache import normalise_node
+from .graph_view import GraphView, name_index
+from .lib import (
+    debug,
+    references_graph_to_igraph,
+    subcomponent_multi
+)
+from .flatten_references_graph import flatten_references_graph
+from .stage_cache import StageCache
+
+# Flattening of many references graphs (e.g. of many images built from the
+# same nixpkgs) in a single run.
+#
+# All graphs are merged into a single (union) igraph graph, which is created
+# only once, and every job is applied to a view of it. Vertices of the view
+# are in the order of vertices of the graph which would have been created
+# for the job alone (see references_graph_to_igraph), so the result of every
+# job is the same as the result of flatten_references_graph for that job.
+#
+# Results of pipeline stages are shared between jobs (see stage_cache.py).
+
+
+def union_nodes(graphs):
+    """Return list of distinct nodes of given references graphs.
+
+    Raises ValueError if graphs contain different nodes with the same path.
+    """
+    nodes = {}
+
+    for node in tlz.concat(graphs):
+        path = node["path"]
+        previous = nodes.setdefault(path, node)
+
+        if (
+            previous is not node and
+            normalise_node(previous) != normalise_node(node)
+        ):
+            raise ValueError(f"Conflicting nodes for path {path}")
+
+    # References to paths which are not in any of the graphs are dropped, so
+    # that they are reported for the jobs referencing them only (see
+    # job_view).
+    return [
+        tlz.assoc(
+            node,
+            "references",
+            [path for path in node["references"] if path in nodes]
+        )
+        for node in nodes.values()
+    ]
+
+
+def job_view(graph, index_by_path, job):
+    """Return view of the union graph with the graph of the given job, in the
+    order of references_graph_to_igraph(job["graph"]).
+
+    If the job has "roots" instead of "graph", the view contains the closure
+    of the roots, in the order of the union graph.
+    """
+    if "graph" not in job:
+        return GraphView(graph, subcomponent_multi(
+            graph,
+            [index_by_path[path] for path in job["roots"]]
+        ))
+
+    nodes = job["graph"]
+    paths = frozenset(node["path"] for node in nodes)
+    # Excluded paths don't need to be in the graph (like in
+    # flatten_references_graph).
+    known_paths = paths.union(job.get("exclude_paths") or [])
+
+    for node in nodes:
+        for reference in node["references"]:
+            if reference not in known_paths:
+                raise KeyError(reference)
+
+    return GraphView(graph, [
+        index_by_path[node["path"]]
+        # Stable sort by narSize, same as references_graph_to_igraph.
+        for node in sorted(nodes, key=lambda node: node.get("narSize"))
+    ])
+
+
+def flatten_references_graph_batch(
+    jobs,
+    graph=None,
+    stage_cache=None,
+    executor=None
+):
+    """Apply pipelines of many jobs and return list of results (see
+    flatten_references_graph).
+
+    Every job is a dict with "pipeline", optional "exclude_paths" and either
+    "graph" (result of exportReferencesGraph), or "roots" (list of paths),
+    which selects the closure of the roots in the graph given as an argument.
+    Graphs of all jobs (and the graph given as an argument) are merged into a
+    single igraph graph.
+
+    executor is passed to flatten_references_graph.
+    """
+    if stage_cache is None:
+        stage_cache = StageCache()
+
+    union_graph = references_graph_to_igraph(union_nodes(
+        ([] if graph is None else [graph]) +
+        [job["graph"] for job in jobs if "graph" in job]
+    ))
+    index_by_path = name_index(union_graph)
+
+    debug("union_graph", union_graph)
+
+    results = [
+        flatten_references_graph(
+            job_view(union_graph, index_by_path, job),
+            job["pipeline"],
+            exclude_paths=job.get("exclude_paths"),
+            stage_cache=stage_cache,
+            executor=executor
+        )
+        for job in jobs
+    ]
+
+    debug("stage_cache hits", stage_cache.hits, "misses", stage_cache.misses)
+
+    return results
@@ -0,0 +1,125 @@
+import unittest
+
+from .batch import flatten_references_graph_batch
+from .flatten_references_graph import flatten_references_graph
+from .lib import (
+    load_json,
+    path_relative_to_file
+)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+def load_real_references_graph():
+    return load_json(path_relative_to_file(
+        __file__,
+        "__test_fixtures/real-references-graph.json"
+    ))
+
+
+def closure_nodes(nodes, root):
+    """Return nodes of the closure of root, in the order of nodes."""
+    node_by_path = {node["path"]: node for node in nodes}
+    closure = set()
+    stack = [root]
+
+    while len(stack) > 0:
+        path = stack.pop()
+        if path not in closure:
+            closure.add(path)
+            stack.extend(node_by_path[path]["references"])
+
+    return [node for node in nodes if node["path"] in closure]
+
+
+pipeline = [
+    ["popularity_contest"],
+    ["limit_layers", 20]
+]
+
+
+class Test(unittest.TestCase):
+
+    def test_same_as_separate_jobs(self):
+        nodes = load_real_references_graph()
+        # Paths with the biggest closures.
+        roots = [
+            node["path"] for node in sorted(
+                nodes,
+                key=lambda node: -len(closure_nodes(nodes, node["path"]))
+            )[:4]
+        ]
+
+        jobs = [
+            {"graph": closure_nodes(nodes, root), "pipeline": pipeline}
+            for root in roots
+        ] + [
+            {
+                # Different order of nodes.
+                "graph": list(reversed(closure_nodes(nodes, roots[1]))),
+                "pipeline": [
+                    ["split_paths", [roots[2]]],
+                    ["over", "rest", ["popularity_contest"]]
+                ],
+                "exclude_paths": [roots[3], "/nix/store/not-in-graph"]
+            }
+        ]
+
+        self.assertListEqual(
+            flatten_references_graph_batch(jobs),
+            [
+                flatten_references_graph(
+                    job["graph"],
+                    job["pipeline"],
+                    exclude_paths=job.get("exclude_paths")
+                )
+                for job in jobs
+            ]
+        )
+
+    def test_roots(self):
+        nodes = load_real_references_graph()
+        root = nodes[100]["path"]
+
+        self.assertListEqual(
+            flatten_references_graph_batch(
+                [{"roots": [root], "pipeline": pipeline}],
+                graph=nodes
+            ),
+            [flatten_references_graph(closure_nodes(nodes, root), pipeline)]
+        )
+
+    def test_errors(self):
+        one_layer = [["popularity_contest"], ["limit_layers", 1]]
+        node_a = {"path": "A", "references": ["B"], "narSize": 1}
+        node_b = {"path": "B", "references": [], "narSize": 1}
+
+        # B is in the graph of another job only.
+        with self.assertRaises(KeyError):
+            flatten_references_graph_batch([
+                {"graph": [node_a], "pipeline": one_layer},
+                {"graph": [node_b], "pipeline": one_layer},
+            ])
+
+        with self.assertRaises(ValueError):
+            flatten_references_graph_batch([
+                {"graph": [node_a, node_b], "pipeline": one_layer},
+                {
+                    "graph": [node_b, {**node_a, "narSize": 2}],
+                    "pipeline": one_layer
+                },
+            ])
+
+        self.assertListEqual(
+            flatten_references_graph_batch([
+                {
+                    "graph": [node_a],
+                    "pipeline": one_layer,
+                    "exclude_paths": ["B"]
+                },
+                {"graph": [node_b, node_a], "pipeline": one_layer},
+            ]),
+            [[["A"]], [["B", "A"]]]
+        )
@@ -0,0 +1,295 @@
+from array import array
+import json as json
+import mmap as mmap
+import struct as struct
+import sys as sys
+
+from .json_stream import iter_object_items
+
+# Compact binary encoding of the input of main_impl (see __main__.py), which
+# can be loaded without parsing (or even copying) the graph.
+#
+# Every path is stored once (in a string table), and references are stored as
+# integer ids of paths. All integers are little endian int64, and all
+# sections are aligned to 8 bytes, so that they can be used straight from the
+# memory mapped file (as memoryviews).
+#
+# Layout:
+#   - MAGIC,
+#   - header: node count (N), string count (S >= N), reference count (R),
+#     size of the string table and size of meta,
+#   - narSize of every node (MISSING if not given),
+#   - closureSize of every node (MISSING if not given),
+#   - reference offsets (N + 1): references of node i are
+#     references[offsets[i]:offsets[i + 1]],
+#   - references (R): string ids,
+#   - string offsets (S + 1) into the string table,
+#   - string table: utf-8 encoded paths, the first N are paths of nodes (in
+#     the order of the input), the rest are referenced paths which are not
+#     nodes (these need to be excluded),
+#   - meta: JSON object with all other keys of the input (pipeline,
+#     exclude_paths).
+
+MAGIC = b"FRG-BIN\x01"
+
+HEADER = struct.Struct("<5q")
+
+MISSING = -1
+
+ALIGNMENT = 8
+
+
+def is_binary_file(file_path):
+    with open(file_path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def padding(size):
+    return -size % ALIGNMENT
+
+
+def int64_array(values=()):
+    result = array("q", values)
+    assert result.itemsize == 8
+    return result
+
+
+def int64_bytes(values):
+    values = int64_array(values)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+def encode_graph(references_graph):
+    """Return header values (apart from the size of meta) and encoded
+    sections of references_graph (any iterable of nodes, consumed in a
+    single pass).
+    """
+    ids = {}
+    paths = []
+
+    def intern(path):
+        path_id = ids.get(path)
+        if path_id is None:
+            path_id = ids[path] = len(paths)
+            paths.append(path)
+        return path_id
+
+    sizes = {"narSize": int64_array(), "closureSize": int64_array()}
+    reference_offsets = int64_array([0])
+    references = int64_array()
+    node_paths = []
+
+    for node in references_graph:
+        path = node["path"]
+        node_paths.append(path)
+
+        for (key, values) in sizes.items():
+            value = node.get(key)
+            values.append(MISSING if value is None else value)
+
+        references.extend(
+            intern(reference) for reference in node["references"]
+            # references might contain source
+            if reference != path
+        )
+        reference_offsets.append(len(references))
+
+    # Paths of nodes get the first ids, in the order of nodes.
+    string_id_by_path = {
+        path: string_id for (string_id, path) in enumerate(node_paths)
+    }
+    if len(string_id_by_path) != len(node_paths):
+        raise ValueError("Duplicate paths in the graph")
+
+    strings = list(node_paths)
+    for path in paths:
+        if path not in string_id_by_path:
+            string_id_by_path[path] = len(strings)
+            strings.append(path)
+
+    string_ids = [string_id_by_path[path] for path in paths]
+    references = int64_array(string_ids[path_id] for path_id in references)
+
+    encoded_strings = [path.encode("utf-8") for path in strings]
+    string_offsets = int64_array([0])
+    for encoded in encoded_strings:
+        string_offsets.append(string_offsets[-1] + len(encoded))
+    string_table = b"".join(encoded_strings)
+
+    return (
+        (len(node_paths), len(strings), len(references), len(string_table)),
+        [
+            int64_bytes(sizes["narSize"]),
+            int64_bytes(sizes["closureSize"]),
+            int64_bytes(reference_offsets),
+            int64_bytes(references),
+            int64_bytes(string_offsets),
+            string_table,
+            b"\0" * padding(len(string_table))
+        ]
+    )
+
+
+def write_binary(f, header_values, sections, meta):
+    meta_bytes = json.dumps(meta, sort_keys=True).encode("utf-8")
+
+    f.write(MAGIC)
+    f.write(HEADER.pack(*header_values, len(meta_bytes)))
+    for section in sections:
+        f.write(section)
+    f.write(meta_bytes)
+
+
+def convert_json_to_binary(json_file_path, binary_file_path):
+    """Convert input of main_impl from JSON to the binary format. The graph
+    is parsed incrementally (see json_stream.py).
+    """
+    meta = {}
+    encoded_graph = None
+
+    with open(json_file_path) as f:
+        for (key, value) in iter_object_items(f, streamed_keys=["graph"]):
+            if key == "graph":
+                encoded_graph = encode_graph(value)
+            else:
+                meta[key] = value
+
+    if encoded_graph is None:
+        raise ValueError("Input has no graph")
+
+    with open(binary_file_path, "wb") as f:
+        write_binary(f, *encoded_graph, meta)
+
+
+def load_binary(file_path, hasher=None):
+    """Load input of main_impl from a file in the binary format, with the
+    graph as an igraph graph. Columns of the graph are used straight from the
+    memory mapped file (see lib.columns_to_igraph).
+
+    If hasher is given, it's updated with the encoded graph (so it can be
+    used as cache.graph_hasher).
+    """
+    # Imported here, so that importing this module doesn't import igraph (see
+    # __main__.py).
+    from .lib import columns_to_igraph
+
+    with open(file_path, "rb") as f, mmap.mmap(
+        f.fileno(),
+        0,
+        access=mmap.ACCESS_READ
+    ) as mapped:
+        # All views of the mapped file need to be released before it's
+        # closed.
+        views = [memoryview(mapped)]
+
+        def view(start, end):
+            if end > len(mapped):
+                raise ValueError(f"{file_path} is truncated")
+            views.append(views[0][start:end])
+            return views[-1]
+
+        position = len(MAGIC) + HEADER.size
+
+        def take(size):
+            nonlocal position
+            start = position
+            position += size + padding(size)
+            return view(start, start + size)
+
+        def take_int64s(count):
+            values = take(8 * count)
+            if sys.byteorder == "big":
+                values = int64_array(values.cast("q"))
+                values.byteswap()
+                return values
+            views.append(values.cast("q"))
+            return views[-1]
+
+        try:
+            if mapped[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{file_path} is not in the binary format")
+
+            (
+                node_count,
+                string_count,
+                reference_count,
+                string_table_size,
+                meta_size
+            ) = HEADER.unpack_from(mapped, len(MAGIC))
+
+            nar_sizes = take_int64s(node_count)
+            closure_sizes = take_int64s(node_count)
+            reference_offsets = take_int64s(node_count + 1)
+            references = take_int64s(reference_count)
+            string_offsets = take_int64s(string_count + 1)
+            string_table = take(string_table_size)
+            graph_end = position
+            meta = json.loads(str(take(meta_size), "utf-8"))
+
+            if hasher is not None:
+                hasher.update(HEADER.pack(
+                    node_count,
+                    string_count,
+                    reference_count,
+                    string_table_size,
+                    0
+                ))
+                hasher.update(view(len(MAGIC) + HEADER.size, graph_end))
+
+            paths = [
+                str(string_table[start:end], "utf-8")
+                for (start, end) in zip(string_offsets, string_offsets[1:])
+            ]
+
+            # Paths which are referenced, but are not nodes, need to be
+            # excluded (like in flatten_references_graph).
+            excluded = frozenset(meta.get("exclude_paths") or [])
+            for path in paths[node_count:]:
+                if path not in excluded:
+                    raise KeyError(path)
+
+            if string_count > node_count:
+                (reference_offsets, references) = without_references_to(
+                    node_count,
+                    reference_offsets,
+                    references
+                )
+
+            graph = columns_to_igraph(
+                paths[:node_count],
+                range(node_count),
+                {
+                    "closureSize": without_missing(closure_sizes),
+                    "narSize": without_missing(nar_sizes)
+                },
+                reference_offsets,
+                references
+            )
+        finally:
+            for values in reversed(views):
+                values.release()
+
+    return {**meta, "graph": graph}
+
+
+def without_missing(values):
+    return [None if value == MISSING else value for value in values]
+
+
+def without_references_to(min_id, reference_offsets, references):
+    """Return reference offsets and references without references to ids >=
+    min_id.
+    """
+    new_offsets = int64_array([0])
+    new_references = int64_array()
+
+    for (start, end) in zip(reference_offsets, reference_offsets[1:]):
+        new_references.extend(
+            reference for reference in references[start:end]
+            if reference < min_id
+        )
+        new_offsets.append(len(new_references))
+
+    return (new_offsets, new_references)
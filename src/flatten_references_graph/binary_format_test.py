@@ -0,0 +1,126 @@
+import json as json
+import os as os
+import tempfile as tempfile
+import unittest
+
+from .__main__ import main_impl
+from .binary_format import (
+    convert_json_to_binary,
+    is_binary_file,
+    load_binary
+)
+from .cache import ResultCache, graph_hasher
+from .lib import (
+    load_json,
+    path_relative_to_file,
+    references_graph_to_igraph
+)
+from . import test_helpers as th
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+def fixture_path(name):
+    return path_relative_to_file(__file__, f"__test_fixtures/{name}")
+
+
+class Test(unittest.TestCase, th.CustomAssertions):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_json(self, data):
+        file_path = os.path.join(self.directory.name, "input.json")
+        with open(file_path, "w") as f:
+            json.dump(data, f)
+        return file_path
+
+    def convert(self, json_file_path):
+        binary_file_path = os.path.join(self.directory.name, "input.bin")
+        convert_json_to_binary(json_file_path, binary_file_path)
+        return binary_file_path
+
+    def test_load_binary(self):
+        references_graph = load_json(fixture_path("real-references-graph.json"))
+        # Missing closureSize.
+        del references_graph[3]["closureSize"]
+
+        data = {
+            "graph": references_graph,
+            "pipeline": [["popularity_contest"]],
+            "exclude_paths": ["/nix/store/x"]
+        }
+        json_file_path = self.write_json(data)
+        binary_file_path = self.convert(json_file_path)
+
+        self.assertFalse(is_binary_file(json_file_path))
+        self.assertTrue(is_binary_file(binary_file_path))
+
+        loaded = load_binary(binary_file_path)
+        expected_graph = references_graph_to_igraph(references_graph)
+
+        self.assertEqual(loaded.pop("pipeline"), data["pipeline"])
+        self.assertEqual(loaded.pop("exclude_paths"), data["exclude_paths"])
+        self.assertGraphEqual(loaded["graph"], expected_graph)
+        # Same order of vertices.
+        self.assertListEqual(
+            loaded["graph"].vs["name"],
+            expected_graph.vs["name"]
+        )
+
+    def test_main_impl(self):
+        references_graph = load_json(fixture_path("real-references-graph.json"))
+        excluded = references_graph[7]["path"]
+        # Referenced, but not in the graph.
+        references_graph[0]["references"].append("/nix/store/missing")
+
+        json_file_path = self.write_json({
+            "graph": references_graph,
+            "pipeline": [["popularity_contest"], ["limit_layers", 20]],
+            "exclude_paths": [excluded, "/nix/store/missing"]
+        })
+        binary_file_path = self.convert(json_file_path)
+
+        expected = main_impl(json_file_path)
+        self.assertEqual(main_impl(binary_file_path), expected)
+
+        cache = ResultCache(os.path.join(self.directory.name, "cache"))
+        for _ in range(2):
+            self.assertEqual(
+                main_impl(binary_file_path, cache=cache),
+                expected
+            )
+        self.assertEqual(len(os.listdir(cache.directory)), 1)
+
+    def test_missing_path(self):
+        file_path = self.convert(self.write_json({
+            "graph": [{"path": "A", "references": ["A", "B"], "narSize": 1}],
+            "pipeline": []
+        }))
+
+        with self.assertRaises(KeyError):
+            load_binary(file_path)
+
+    def test_hasher(self):
+        data = load_json(
+            fixture_path("flatten-references-graph-main-input.json")
+        )
+
+        def digest(data):
+            hasher = graph_hasher()
+            load_binary(self.convert(self.write_json(data)), hasher=hasher)
+            return hasher.hexdigest()
+
+        self.assertEqual(
+            digest(data),
+            digest({**data, "pipeline": [["popularity_contest"]]})
+        )
+        self.assertNotEqual(
+            digest(data),
+            digest({**data, "graph": data["graph"][1:]})
+        )
@@ -0,0 +1,36 @@
+import itertools as itertools
+
+# Sets of vertex ids (or positions in a view) stored as ints used as packed
+# bitsets: bit i is set iff i is in the set. Set operations are then single
+# int operations (&, |, & ~), done in C a machine word at a time.
+
+binary_digits_to_bytes = bytes.maketrans(b"01", b"\x00\x01")
+
+bytes_to_binary_digits = bytes.maketrans(b"\x00\x01", b"01")
+
+
+def from_flags(flags):
+    """Return bitset of indices of non-zero elements of flags (bytes or
+    bytearray of 0s and 1s).
+    """
+    if len(flags) == 0:
+        return 0
+    # The most significant binary digit comes first.
+    return int(flags[::-1].translate(bytes_to_binary_digits), 2)
+
+
+# Return an iterator over indices of bits set in an int used as a bitset (in
+# descending order). Iteration happens in C (via itertools.compress), which
+# is much faster than testing bits one by one in python.
+def iter_set_bits(bitset):
+    digits = format(bitset, "b").encode("ascii").translate(
+        binary_digits_to_bytes
+    )
+    return itertools.compress(range(len(digits) - 1, -1, -1), digits)
+
+
+def set_bits(bitset):
+    """Return list of indices of bits set in bitset, in ascending order."""
+    result = list(iter_set_bits(bitset))
+    result.reverse()
+    return result
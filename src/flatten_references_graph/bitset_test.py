@@ -0,0 +1,30 @@
+import unittest
+
+from .bitset import (
+    from_flags,
+    iter_set_bits,
+    set_bits
+)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class Test(unittest.TestCase):
+
+    def test_from_flags(self):
+        self.assertEqual(from_flags(b""), 0)
+        self.assertEqual(from_flags(b"\0\0"), 0)
+        self.assertEqual(from_flags(bytearray(b"\1\0\1\1")), 0b1101)
+
+    def test_set_bits(self):
+        self.assertListEqual(list(iter_set_bits(0b1101)), [3, 2, 0])
+        self.assertListEqual(set_bits(0b1101), [0, 2, 3])
+        self.assertListEqual(set_bits(0), [])
+
+        flags = bytes([1 if i % 7 == 0 else 0 for i in range(1000)])
+        self.assertListEqual(
+            set_bits(from_flags(flags)),
+            list(range(0, 1000, 7))
+        )
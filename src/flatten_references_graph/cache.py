@@ -0,0 +1,144 @@
+import hashlib as hashlib
+import json as json
+import os as os
+import tempfile as tempfile
+
+from . import __version__
+
+# On-disk cache of main_impl results, keyed by a hash of everything the
+# result depends on: the graph (only the parts of it which are used), the
+# pipeline, exclude_paths and the version of this package.
+#
+# Entries are written atomically (to a temporary file which is then renamed),
+# so the cache directory can be shared by concurrent processes. The least
+# recently used entries (by modification time, which is updated on every hit)
+# are removed when the total size of the cache exceeds max_size.
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+ENTRY_SUFFIX = ".json"
+
+
+def json_bytes(value):
+    return json.dumps(
+        value,
+        sort_keys=True,
+        separators=(",", ":")
+    ).encode("utf-8")
+
+
+def normalise_node(node):
+    path = node["path"]
+
+    # Node order, and order of references, is preserved since it determines
+    # the order of vertices (and edges) of the graph, and so the result.
+    return [
+        path,
+        [reference for reference in node["references"] if reference != path],
+        node.get("narSize"),
+        node.get("closureSize")
+    ]
+
+
+def hashing_nodes(hasher, nodes):
+    """Yield nodes of a references graph, adding each of them to the hash."""
+    for node in nodes:
+        hasher.update(json_bytes(normalise_node(node)))
+        hasher.update(b"\n")
+        yield node
+
+
+def graph_hasher():
+    return hashlib.sha256(b"graph\n")
+
+
+def result_key(graph_hasher, pipeline, exclude_paths, compact=False):
+    """Return cache key, given a hasher which has been updated with all nodes
+    of the graph (see hashing_nodes).
+
+    Results are formatted differently in compact mode (see json_output.py),
+    so they have different keys.
+    """
+    hasher = hashlib.sha256(json_bytes([
+        __version__,
+        graph_hasher.hexdigest(),
+        pipeline,
+        # Order of exclude_paths doesn't matter.
+        None if exclude_paths is None else sorted(frozenset(exclude_paths)),
+        *(["compact"] if compact else [])
+    ]))
+
+    return hasher.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def get(self, key):
+        """Return cached value, or None if there is no entry for given key."""
+        path = self.entry_path(key)
+
+        try:
+            with open(path) as f:
+                value = f.read()
+            # Mark as recently used.
+            os.utime(path)
+        # Entry might be evicted by another process at any time.
+        except FileNotFoundError:
+            return None
+
+        return value
+
+    def put(self, key, value):
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Temporary files don't have ENTRY_SUFFIX, so are never read or
+        # evicted as entries.
+        (fd, temp_path) = tempfile.mkstemp(
+            dir=self.directory,
+            prefix=".tmp-"
+        )
+
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(value)
+            # mkstemp creates files readable only by the owner.
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, self.entry_path(key))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(ENTRY_SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_size = sum(size for (_, size, _) in entries)
+
+        # Least recently used first.
+        for (_, size, path) in sorted(entries):
+            if total_size <= self.max_size:
+                break
+
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+            total_size -= size
@@ -0,0 +1,176 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from . import __main__ as main_module
+from . import flatten_references_graph as flatten_references_graph_module
+
+from .cache import (
+    ResultCache,
+    graph_hasher,
+    hashing_nodes,
+    result_key
+)
+from .lib import load_json, path_relative_to_file
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+references_graph = [
+    {
+        "closureSize": 1,
+        "narHash": "sha256:a",
+        "narSize": 2,
+        "path": "A",
+        "references": ["A", "B"]
+    },
+    {
+        "closureSize": 3,
+        "narHash": "sha256:b",
+        "narSize": 4,
+        "path": "B",
+        "references": []
+    },
+]
+
+
+def key(graph, pipeline=[["popularity_contest"]], exclude_paths=None):
+    hasher = graph_hasher()
+    list(hashing_nodes(hasher, graph))
+    return result_key(hasher, pipeline, exclude_paths)
+
+
+class TestResultKey(unittest.TestCase):
+
+    def test_ignores_unused_data(self):
+        self.assertEqual(
+            key(references_graph),
+            key([
+                {
+                    "path": "A",
+                    "narHash": "sha256:other",
+                    "narSize": 2,
+                    "closureSize": 1,
+                    # Self reference is ignored
+                    "references": ["B"]
+                },
+                references_graph[1]
+            ])
+        )
+
+        self.assertEqual(
+            key(references_graph, exclude_paths=["A", "B"]),
+            key(references_graph, exclude_paths=["B", "A", "A"])
+        )
+
+    def test_depends_on_inputs(self):
+        keys = [
+            key(references_graph),
+            # Order of nodes determines order of vertices.
+            key(list(reversed(references_graph))),
+            key([
+                dict(references_graph[0], narSize=5),
+                references_graph[1]
+            ]),
+            key(references_graph, pipeline=[["split_every", 1]]),
+            key(references_graph, exclude_paths=[]),
+            key(references_graph, exclude_paths=["B"]),
+        ]
+
+        self.assertEqual(len(frozenset(keys)), len(keys))
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.temp_dir.name, "cache")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_get_put(self):
+        cache = ResultCache(self.directory)
+
+        self.assertIsNone(cache.get("a"))
+
+        cache.put("a", "value a")
+        cache.put("b", "value b")
+
+        self.assertEqual(cache.get("a"), "value a")
+        self.assertEqual(cache.get("b"), "value b")
+
+        cache.put("a", "new value a")
+        self.assertEqual(cache.get("a"), "new value a")
+
+        # No temporary files are left behind.
+        self.assertCountEqual(
+            os.listdir(self.directory),
+            ["a.json", "b.json"]
+        )
+
+    def test_evicts_least_recently_used(self):
+        cache = ResultCache(self.directory, max_size=25)
+
+        def put(key, mtime):
+            cache.put(key, "0123456789")
+            os.utime(cache.entry_path(key), (mtime, mtime))
+
+        put("a", 1)
+        put("b", 2)
+
+        # Reading an entry marks it as most recently used.
+        self.assertIsNotNone(cache.get("a"))
+
+        put("c", 3)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+
+
+class TestMainImplCache(unittest.TestCase):
+
+    def test_main_impl_cache(self):
+        file_path = path_relative_to_file(
+            __file__,
+            "__test_fixtures/flatten-references-graph-main-input.json"
+        )
+
+        expected = main_module.main_impl(file_path)
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResultCache(directory)
+
+            self.assertEqual(
+                main_module.main_impl(file_path, cache=cache),
+                expected
+            )
+
+            # Results are taken from the cache, in both modes.
+            with mock.patch.object(
+                flatten_references_graph_module,
+                "flatten_references_graph",
+                side_effect=AssertionError("should not be called")
+            ):
+                for stream in [False, True]:
+                    self.assertEqual(
+                        main_module.main_impl(
+                            file_path,
+                            stream=stream,
+                            cache=cache
+                        ),
+                        expected
+                    )
+
+            data = load_json(file_path)
+
+            self.assertEqual(
+                os.listdir(directory),
+                [
+                    key(data["graph"], data["pipeline"]) + ".json"
+                ]
+            )
@@ -0,0 +1,147 @@
+import collections as collections
+import json as json
+import os as os
+import signal as signal
+import socketserver as socketserver
+import sys as sys
+import threading as threading
+import traceback as traceback
+
+import igraph as igraph
+
+from .binary_format import is_binary_file, load_binary
+from .cache import graph_hasher, hashing_nodes
+from .flatten_references_graph import flatten_references_graph
+from .incremental import Relayering
+from .lib import debug, load_json, references_graph_to_igraph
+from .pipe import compile_pipeline
+
+# Long running process answering requests over a Unix socket, so that the
+# cost of starting the interpreter (and importing igraph) is paid once, and
+# graphs, compiled pipelines (see pipe.compile_pipeline) and the state of
+# incremental re-layering of every graph (see incremental.py) are reused
+# between requests.
+#
+# Every connection carries a single request: a JSON object in the format of
+# the input of main_impl (or {"file_path": path of such input}), followed by
+# the end of the stream (the client shuts down writing). The response is a
+# JSON object with either "result" (list of layers) or "error" key (see
+# daemon_client.py).
+
+DEFAULT_MAX_GRAPHS = 16
+
+
+class LayeringServer(
+    socketserver.ThreadingMixIn,
+    socketserver.UnixStreamServer
+):
+    daemon_threads = True
+
+    def __init__(self, socket_path, max_graphs=DEFAULT_MAX_GRAPHS):
+        super().__init__(socket_path, RequestHandler)
+        self.max_graphs = max_graphs
+        # Pairs of igraph graph and its Relayering by digest of the
+        # references graph (see cache.hashing_nodes), least recently used
+        # first.
+        self.graphs = collections.OrderedDict()
+        self.graphs_lock = threading.Lock()
+
+    def graph_entry(self, references_graph, hasher):
+        """Return (igraph graph, Relayering) kept for references_graph (list
+        of nodes, or igraph graph loaded from a file in the binary format),
+        hashed by hasher. The graph is None if it can't be created (if it
+        references paths which are not in the graph, which is allowed if
+        they are excluded).
+        """
+        key = hasher.hexdigest()
+
+        with self.graphs_lock:
+            entry = self.graphs.get(key)
+            if entry is not None:
+                self.graphs.move_to_end(key)
+                return entry
+
+            latest = next(reversed(self.graphs.values()), None)
+
+        if isinstance(references_graph, igraph.Graph):
+            graph = references_graph
+        else:
+            try:
+                graph = references_graph_to_igraph(references_graph)
+            except KeyError:
+                graph = None
+
+        relayering = Relayering()
+
+        if latest is not None:
+            # Popularity for a new graph (e.g. of the next version of an
+            # image) is computed incrementally from the most recent one.
+            (_, latest_relayering) = latest
+            with latest_relayering.lock:
+                relayering.records.extend(latest_relayering.records)
+
+        with self.graphs_lock:
+            entry = self.graphs.setdefault(key, (graph, relayering))
+            self.graphs.move_to_end(key)
+            while len(self.graphs) > self.max_graphs:
+                self.graphs.popitem(last=False)
+
+        return entry
+
+    def process(self, request):
+        hasher = graph_hasher()
+
+        if "file_path" in request:
+            file_path = request["file_path"]
+            request = (
+                load_binary(file_path, hasher=hasher)
+                if is_binary_file(file_path)
+                else load_json(file_path)
+            )
+
+        references_graph = request["graph"]
+        pipeline = compile_pipeline(request["pipeline"])
+
+        # Graphs loaded from files in the binary format are hashed while
+        # they are loaded.
+        if not isinstance(references_graph, igraph.Graph):
+            for _ in hashing_nodes(hasher, references_graph):
+                pass
+
+        (graph, relayering) = self.graph_entry(references_graph, hasher)
+
+        return flatten_references_graph(
+            references_graph if graph is None else graph,
+            pipeline,
+            exclude_paths=request.get("exclude_paths"),
+            previous=relayering
+        )
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            result = {
+                "result": self.server.process(json.loads(self.rfile.read()))
+            }
+        except Exception as e:
+            debug(traceback.format_exc())
+            result = {"error": f"{type(e).__name__}: {e}"}
+
+        self.wfile.write(json.dumps(result).encode("utf-8"))
+
+
+def serve(socket_path, max_graphs=DEFAULT_MAX_GRAPHS):
+    # Socket left by a previous instance.
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    # Clean up (remove the socket) when terminated.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    with LayeringServer(socket_path, max_graphs) as server:
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(socket_path)
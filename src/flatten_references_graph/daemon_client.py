@@ -0,0 +1,27 @@
+import json as json
+import socket as socket
+
+# Client of the daemon (see daemon.py). Doesn't depend on igraph or toolz, so
+# that sending a request is cheap.
+
+
+class DaemonError(Exception):
+    pass
+
+
+def send_request(socket_path, request):
+    """Send request to the daemon listening on socket_path and return the
+    result. Raises DaemonError if the request failed.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        connection.sendall(json.dumps(request).encode("utf-8"))
+        connection.shutdown(socket.SHUT_WR)
+
+        with connection.makefile("rb") as f:
+            response = json.load(f)
+
+    if "error" in response:
+        raise DaemonError(response["error"])
+
+    return response["result"]
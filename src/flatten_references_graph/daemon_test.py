@@ -0,0 +1,126 @@
+import json as json
+import os as os
+import tempfile as tempfile
+import threading as threading
+import unittest
+
+from .__main__ import main_impl
+from .daemon import LayeringServer
+from .daemon_client import (
+    DaemonError,
+    send_request
+)
+from .flatten_references_graph import flatten_references_graph
+from .lib import (
+    load_json,
+    path_relative_to_file
+)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.directory.name, "socket")
+        self.server = LayeringServer(self.socket_path, max_graphs=1)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def test_requests(self):
+        file_path = path_relative_to_file(
+            __file__,
+            "__test_fixtures/flatten-references-graph-main-input.json"
+        )
+        data = load_json(file_path)
+        expected = json.loads(main_impl(file_path))
+
+        self.assertListEqual(
+            send_request(self.socket_path, {"file_path": str(file_path)}),
+            expected
+        )
+        graph = list(self.server.graphs.values())[0]
+
+        # Same graph is reused.
+        self.assertListEqual(send_request(self.socket_path, data), expected)
+        self.assertIs(list(self.server.graphs.values())[0], graph)
+
+        # Referenced path which is not in the graph, but is excluded.
+        graph_with_missing_path = [
+            {**node, "references": node["references"] + ["X"]}
+            for node in data["graph"]
+        ]
+        self.assertListEqual(
+            send_request(
+                self.socket_path,
+                {
+                    **data,
+                    "graph": graph_with_missing_path,
+                    "exclude_paths": ["X", "A"]
+                }
+            ),
+            flatten_references_graph(
+                graph_with_missing_path,
+                data["pipeline"],
+                exclude_paths=["X", "A"]
+            )
+        )
+
+        with self.assertRaisesRegex(DaemonError, "KeyError: 'X'"):
+            send_request(
+                self.socket_path,
+                {**data, "graph": graph_with_missing_path}
+            )
+
+        with self.assertRaisesRegex(DaemonError, "unknown function"):
+            send_request(self.socket_path, {**data, "pipeline": [["foo"]]})
+
+    def test_real_graph(self):
+        references_graph = load_json(path_relative_to_file(
+            __file__,
+            "__test_fixtures/real-references-graph.json"
+        ))
+        data = {
+            "graph": references_graph,
+            "pipeline": [["popularity_contest"], ["limit_layers", 10]],
+            "exclude_paths": [references_graph[5]["path"]]
+        }
+
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+            json.dump(data, f)
+            f.flush()
+            expected = json.loads(main_impl(f.name))
+
+        self.assertListEqual(send_request(self.socket_path, data), expected)
+        [(_, relayering)] = self.server.graphs.values()
+        recomputed = relayering.recomputed
+
+        self.assertListEqual(send_request(self.socket_path, data), expected)
+        self.assertEqual(relayering.recomputed, recomputed)
+
+        # Popularity for a changed graph is computed incrementally, even if
+        # the previous graph is not kept anymore (max_graphs is 1).
+        changed = {**data, "graph": references_graph[:-1] + [
+            {**references_graph[-1], "narSize": 1}
+        ]}
+
+        self.assertListEqual(
+            send_request(self.socket_path, changed),
+            flatten_references_graph(
+                changed["graph"],
+                changed["pipeline"],
+                exclude_paths=changed["exclude_paths"]
+            )
+        )
+        [(_, changed_relayering)] = self.server.graphs.values()
+        self.assertIsNot(changed_relayering, relayering)
+        self.assertGreater(changed_relayering.reused, 0)
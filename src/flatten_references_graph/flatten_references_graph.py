@@ -1,12 +1,18 @@
 from toolz import curried as tlz
+import igraph as igraph
 
 from .lib import (
     flatten,
+    is_view,
     over,
-    references_graph_to_igraph
+    references_graph_to_igraph,
+    remove_paths,
+    vertex_names
 )
 
-from .pipe import pipe
+from .graph_view import frozen_graph
+from .pipe import compile_pipeline, pipe
+from .stage_cache import fingerprint
 
 MAX_LAYERS = 127
 
@@ -15,12 +21,22 @@ def create_list_of_lists_of_strings(deeply_nested_lists_or_dicts_of_graphs):
     list_or_graphs = flatten(deeply_nested_lists_or_dicts_of_graphs)
 
     return list(tlz.map(
-        lambda g: g.vs["name"],
+        vertex_names,
         list_or_graphs
     ))
 
 
-def flatten_references_graph(references_graph, pipeline, exclude_paths=None):
+def input_graph(references_graph, exclude_paths=None):
+    """Return graph (or view) the pipeline is applied to by
+    flatten_references_graph: references_graph (see there) without
+    exclude_paths.
+    """
+    if is_view(references_graph) or isinstance(references_graph, igraph.Graph):
+        return (
+            references_graph if exclude_paths is None
+            else remove_paths(list(exclude_paths), references_graph)
+        )
+
     if exclude_paths is not None:
         exclude_paths = frozenset(exclude_paths)
         references_graph = tlz.compose(
@@ -31,9 +47,75 @@ def flatten_references_graph(references_graph, pipeline, exclude_paths=None):
             tlz.remove(lambda node: node["path"] in exclude_paths)
         )(references_graph)
 
-    igraph_graph = references_graph_to_igraph(references_graph)
+    return references_graph_to_igraph(references_graph)
 
-    return create_list_of_lists_of_strings(pipe(
-        pipeline,
-        igraph_graph
-    ))
+
+def input_key(pipeline, graph):
+    """Return key of the input of flatten_references_graph (compiled
+    pipeline, and graph returned by input_graph), the same for inputs with
+    the same result.
+    """
+    return (pipeline.digest, fingerprint(graph))
+
+
+def flatten_references_graph(
+    references_graph,
+    pipeline,
+    exclude_paths=None,
+    stage_cache=None,
+    executor=None,
+    previous=None
+):
+    """Apply pipeline to references_graph (result of exportReferencesGraph,
+    or an igraph graph created from it, or a view of such graph) and return a
+    list of layers (list of paths each).
+
+    If stage_cache is given, results of pipeline stages are memoised in it,
+    and if executor is given, independent branches of the pipeline are
+    evaluated in it concurrently (see pipe.pipe).
+
+    If previous (an incremental.Relayering) is given, it's used as the stage
+    cache, and the result is computed incrementally from the previous call
+    with the same previous: the previous layers are returned if neither the
+    graph nor the pipeline changed, and popularity is only recomputed for the
+    vertices affected by the changes of the graph (see incremental.py). The
+    result is the same as without previous.
+    """
+    if previous is not None:
+        if stage_cache is not None:
+            raise ValueError(
+                "Only one of stage_cache and previous can be given"
+            )
+        stage_cache = previous
+
+    graph = input_graph(references_graph, exclude_paths)
+
+    # Graphs given by callers don't change while the pipeline is applied, so
+    # data derived from them is cached meanwhile (see graph_view.derived).
+    with frozen_graph(graph):
+        if previous is None:
+            return create_list_of_lists_of_strings(pipe(
+                pipeline,
+                graph,
+                stage_cache=stage_cache,
+                executor=executor
+            ))
+
+        pipeline = compile_pipeline(pipeline)
+        key = input_key(pipeline, graph)
+
+        with previous.lock:
+            (previous_key, layers) = (previous.input_key, previous.layers)
+
+        if key != previous_key:
+            layers = create_list_of_lists_of_strings(pipe(
+                pipeline,
+                graph,
+                stage_cache=stage_cache,
+                executor=executor
+            ))
+
+            with previous.lock:
+                (previous.input_key, previous.layers) = (key, layers)
+
+        return [list(layer) for layer in layers]
@@ -0,0 +1,427 @@
+from array import array
+import contextlib as contextlib
+import weakref as weakref
+
+import igraph as igraph
+
+
+class GraphView:
+    """An ordered subset of vertices of a (base) igraph graph.
+
+    Stores a reference to the base graph and a compact array of (distinct)
+    base graph vertex indices, so that creating a view doesn't copy any part
+    of the base graph.
+
+    The view behaves like the graph it represents: vertices of the
+    represented graph are the vertices at the given indices (in the same
+    order), and its edges are all edges of the base graph between these
+    vertices (or no edges at all if with_edges is False), apart from edges
+    pointing at vertices with indices in excluded_targets (as if they were
+    deleted). The graph is only created (and cached) when vs or es attributes
+    are accessed.
+    """
+
+    __slots__ = (
+        "graph",
+        "indices",
+        "with_edges",
+        "excluded_targets",
+        "_materialized",
+        "_position_by_index"
+    )
+
+    def __init__(
+        self,
+        graph,
+        indices,
+        with_edges=True,
+        excluded_targets=frozenset()
+    ):
+        self.graph = graph
+        self.indices = array("q", indices)
+        self.with_edges = with_edges
+        # Only indices of vertices of the view are kept, so that views can be
+        # merged (see merge_views).
+        self.excluded_targets = (
+            frozenset(excluded_targets).intersection(self.indices)
+            if excluded_targets else frozenset()
+        )
+        self._materialized = None
+        self._position_by_index = None
+
+    def __repr__(self):
+        return f"GraphView({self.names!r})"
+
+    @property
+    def names(self):
+        return self.graph.vs.select(self.indices)["name"]
+
+    def vcount(self):
+        return len(self.indices)
+
+    def select(self, positions):
+        """Return a view of vertices at given positions of this view."""
+        indices = self.indices
+        return GraphView(
+            self.graph,
+            (indices[position] for position in positions),
+            self.with_edges,
+            self.excluded_targets
+        )
+
+    def without_edges_into(self, positions):
+        """Return the view without edges pointing at vertices at given
+        positions of this view.
+        """
+        indices = self.indices
+        return GraphView(
+            self.graph,
+            indices,
+            self.with_edges,
+            self.excluded_targets.union(
+                indices[position] for position in positions
+            )
+        )
+
+    def position_by_index(self):
+        """Return (cached) dict mapping base graph vertex indices of the view
+        to their positions in the view.
+        """
+        if self._position_by_index is None:
+            self._position_by_index = {
+                index: position
+                for (position, index) in enumerate(self.indices)
+            }
+        return self._position_by_index
+
+    def find_many(self, names):
+        """Return positions in the view of vertices with the given names (in
+        the order of names), skipping names of vertices not in the view.
+        """
+        graph = self.graph
+        position = self.position_by_index()
+
+        return [
+            position[index]
+            for index in (find_index(graph, name) for name in names)
+            if index in position
+        ]
+
+    def covers_graph(self):
+        """Return True if the view contains all vertices and edges of the
+        base graph, in the same order.
+        """
+        return (
+            self.with_edges and
+            not self.excluded_targets and
+            self.indices == array("q", range(self.graph.vcount()))
+        )
+
+    def materialize(self):
+        """Return igraph graph represented by the view. Vertex at position i
+        of the view is the vertex with index i in the returned graph.
+
+        NOTE: if the view covers the whole base graph, the base graph itself
+        is returned, so the result must not be modified.
+        """
+        if self._materialized is None and self.covers_graph():
+            self._materialized = self.graph
+
+        if self._materialized is None:
+            graph = self.graph
+            position = self.position_by_index()
+            vertices = graph.vs.select(self.indices)
+            edges = graph.es.select(
+                _within=self.indices if self.with_edges else []
+            )
+            excluded = self.excluded_targets
+            if excluded:
+                edges = edges.select(lambda e: e.target not in excluded)
+
+            self._materialized = owned_graph(igraph.Graph(
+                n=len(self.indices),
+                edges=[
+                    (position[source], position[target])
+                    for (source, target) in (e.tuple for e in edges)
+                ],
+                directed=graph.is_directed(),
+                graph_attrs={
+                    name: graph[name] for name in graph.attributes()
+                },
+                vertex_attrs={
+                    name: vertices[name] for name in graph.vs.attributes()
+                },
+                edge_attrs={
+                    name: edges[name] for name in graph.es.attributes()
+                },
+            ))
+
+        return self._materialized
+
+    @property
+    def vs(self):
+        return self.materialize().vs
+
+    @property
+    def es(self):
+        return self.materialize().es
+
+
+# Data derived from base graphs (adjacency lists, name index) is computed once
+# per graph, for graphs which are known not to change: graphs created by the
+# package (see owned_graph), which are never modified (see
+# GraphView.materialize), and graphs given by callers while the package works
+# on them (see frozen_graph). Graphs given by callers might be modified in any
+# way between calls (e.g. edges rewired without changing their number), so
+# for any other graph the data is computed on every call. igraph graphs are
+# not hashable, so the cache is keyed by id, and entries of graphs created by
+# the package are removed when the graph is garbage collected.
+derived_cache = {}
+
+
+def owned_graph(graph):
+    """Mark graph created by the package (which is never modified) as such,
+    so that data derived from it is cached. Returns the graph.
+    """
+    graph_id = id(graph)
+
+    if graph_id not in derived_cache:
+        derived_cache[graph_id] = {}
+        weakref.finalize(graph, derived_cache.pop, graph_id, None)
+
+    return graph
+
+
+@contextlib.contextmanager
+def frozen_graph(graph_or_view):
+    """Cache data derived from the graph (or the base graph of the view)
+    within the context, where the graph must not be modified.
+    """
+    graph = graph_or_view.graph if is_view(graph_or_view) else graph_or_view
+    graph_id = id(graph)
+
+    if graph_id in derived_cache:
+        yield
+        return
+
+    derived_cache[graph_id] = {}
+    try:
+        yield
+    finally:
+        derived_cache.pop(graph_id, None)
+
+
+def derived(graph, key, compute):
+    """Return compute(graph), computed once per graph and key for graphs
+    which don't change (see derived_cache), on every call otherwise.
+    """
+    values = derived_cache.get(id(graph))
+
+    if values is None:
+        return compute(graph)
+
+    if key not in values:
+        values[key] = compute(graph)
+
+    return values[key]
+
+
+def adjacency(graph, mode="out"):
+    """Return (cached, see derived) list of successor (mode="out") or
+    predecessor (mode="in") lists of all vertices of the graph.
+    """
+    return derived(
+        graph,
+        ("adjacency", mode),
+        lambda graph: graph.get_adjlist(mode=mode)
+    )
+
+
+def name_index(graph):
+    """Return (cached, see derived) dict mapping names of vertices of the
+    graph to their indices.
+    """
+    return derived(
+        graph,
+        "name_index",
+        lambda graph: {
+            name: index for (index, name) in enumerate(graph.vs["name"])
+        }
+    )
+
+
+def find_many(graph_or_view, names):
+    """Return indices (positions for views) of vertices with the given names
+    (in the order of names), skipping names of vertices not in the graph.
+    """
+    if is_view(graph_or_view):
+        return graph_or_view.find_many(names)
+
+    return [
+        index
+        for index in (find_index(graph_or_view, name) for name in names)
+        if index is not None
+    ]
+
+
+def find_index(graph, name):
+    """Return index of the vertex of the graph with the given name, or None
+    if there is no such vertex.
+
+    NOTE: find by name is constant time (igraph keeps an index of names,
+    which is updated when the graph is modified).
+    """
+    try:
+        return graph.vs.find(name=name).index
+    except ValueError:
+        return None
+
+
+def view_edges(view):
+    """Return edges of the base graph between vertices of the view, as pairs
+    of positions in the view (without materializing the view).
+
+    NOTE: with_edges of the view is ignored (excluded_targets are not).
+    """
+    position = view.position_by_index()
+    successors = adjacency(view.graph)
+    excluded = view.excluded_targets
+
+    return [
+        (source_position, position[target])
+        for (source_position, source) in enumerate(view.indices)
+        for target in successors[source]
+        if target in position and target not in excluded
+    ]
+
+
+def view_adjacency(view, mode="out"):
+    """Return successor (mode="out") or predecessor (mode="in") lists of all
+    vertices of the graph represented by the view (as positions in the
+    view), without materializing the view.
+    """
+    if not view.with_edges:
+        return [[] for _ in range(view.vcount())]
+
+    if view.covers_graph():
+        return adjacency(view.graph, mode)
+
+    position = view.position_by_index()
+    neighbors = adjacency(view.graph, mode)
+    excluded = view.excluded_targets
+
+    if mode == "in":
+        return [
+            [] if index in excluded else [
+                position[neighbor] for neighbor in neighbors[index]
+                if neighbor in position
+            ]
+            for index in view.indices
+        ]
+
+    return [
+        [
+            position[neighbor] for neighbor in neighbors[index]
+            if neighbor in position and neighbor not in excluded
+        ]
+        for index in view.indices
+    ]
+
+
+def reachable(successors, sources, excluded=None):
+    """Return flags (a bytearray, 1 for every reached vertex) of vertices
+    reachable from sources (including sources) in the graph given by
+    successor lists.
+
+    Vertices flagged in excluded (a bytearray of the same length) are treated
+    as if they were not in the graph: they are never reached, even if they
+    are sources.
+    """
+    reached = bytearray(len(successors)) if excluded is None else (
+        bytearray(excluded)
+    )
+    stack = []
+
+    for source in sources:
+        if not reached[source]:
+            reached[source] = 1
+            stack.append(source)
+
+    while stack:
+        for target in successors[stack.pop()]:
+            if not reached[target]:
+                reached[target] = 1
+                stack.append(target)
+
+    if excluded is not None:
+        # Clear flags of excluded vertices, by subtracting them.
+        reached = bytearray(map(int.__sub__, reached, excluded))
+
+    return reached
+
+
+def is_view(x):
+    return isinstance(x, GraphView)
+
+
+def is_graph_or_view(x):
+    return isinstance(x, (GraphView, igraph.Graph))
+
+
+def as_view(graph_or_view):
+    return (
+        graph_or_view if is_view(graph_or_view)
+        else GraphView(graph_or_view, range(graph_or_view.vcount()))
+    )
+
+
+def as_graph(graph_or_view):
+    return (
+        graph_or_view.materialize() if is_view(graph_or_view)
+        else graph_or_view
+    )
+
+
+def vertex_names(graph_or_view):
+    return (
+        graph_or_view.names if is_view(graph_or_view)
+        else graph_or_view.vs["name"]
+    )
+
+
+def merge_views(views):
+    """Merge views of the same base graph into a single view representing
+    the disjoint union of the graphs represented by the views, with vertices
+    in the order of the given views.
+
+    Returns None if the union can't be represented by a view of the base
+    graph: if any vertex is in more than one of the views, or if the base
+    graph has edges between the vertices which are not edges of any of the
+    views (e.g. edges from one view to another).
+    """
+    part_by_index = {}
+    indices = array("q")
+    excluded = frozenset().union(*(view.excluded_targets for view in views))
+
+    for (part, view) in enumerate(views):
+        for index in view.indices:
+            if part_by_index.setdefault(index, part) != part:
+                return None
+        if len(part_by_index) != len(indices) + view.vcount():
+            # Repeated index within the view.
+            return None
+        indices.extend(view.indices)
+
+    if not any(view.with_edges for view in views):
+        return GraphView(views[0].graph, indices, with_edges=False)
+
+    successors = adjacency(views[0].graph)
+
+    for (index, part) in part_by_index.items():
+        for target in successors[index]:
+            if target in part_by_index and target not in excluded and (
+                part_by_index[target] != part or not views[part].with_edges
+            ):
+                return None
+
+    return GraphView(views[0].graph, indices, excluded_targets=excluded)
@@ -0,0 +1,295 @@
+import unittest
+
+from . import test_helpers as th
+
+from .graph_view import (
+    GraphView,
+    adjacency,
+    as_graph,
+    find_many,
+    frozen_graph,
+    merge_views,
+    name_index,
+    owned_graph,
+    reachable,
+    vertex_names,
+    view_adjacency,
+    view_edges
+)
+
+from .lib import (
+    directed_graph,
+    find_vertex_by_name_or_none,
+    pick_keys,
+    subcomponent_multi
+)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+# Making sure vertex attrs are preserved.
+vertex_props_dict = {
+    "A": {"narSize": 1},
+    "C": {"narSize": 3}
+}
+
+
+def make_test_graph():
+    edges = [
+        ("A", "B"),
+        ("B", "C"),
+        ("A", "D"),
+    ]
+
+    return directed_graph(edges, None, vertex_props_dict.items())
+
+
+def indices_of(graph, names):
+    return [graph.vs.find(name).index for name in names]
+
+
+class Test(
+    unittest.TestCase,
+    th.CustomAssertions
+):
+
+    def test_names(self):
+        graph = make_test_graph()
+        view = GraphView(graph, indices_of(graph, ["C", "A", "B"]))
+
+        self.assertListEqual(view.names, ["C", "A", "B"])
+        self.assertListEqual(vertex_names(view), ["C", "A", "B"])
+        self.assertListEqual(vertex_names(graph), graph.vs["name"])
+        self.assertEqual(view.vcount(), 3)
+
+    def test_materialize(self):
+        graph = make_test_graph()
+        view = GraphView(graph, indices_of(graph, ["C", "A", "B"]))
+
+        self.assertGraphEqual(
+            view,
+            directed_graph(
+                [("A", "B"), ("B", "C")],
+                None,
+                vertex_props_dict.items()
+            )
+        )
+
+        # Vertices are in the order of the view.
+        self.assertListEqual(view.vs["name"], ["C", "A", "B"])
+        self.assertIs(as_graph(view), view.materialize())
+        self.assertIs(as_graph(graph), graph)
+
+    def test_materialize_without_edges(self):
+        graph = make_test_graph()
+        view = GraphView(
+            graph,
+            indices_of(graph, ["A", "B"]),
+            with_edges=False
+        )
+
+        self.assertGraphEqual(
+            view,
+            directed_graph(
+                [],
+                ["A", "B"],
+                pick_keys(["A"], vertex_props_dict).items()
+            )
+        )
+
+    def test_materialize_empty(self):
+        view = GraphView(make_test_graph(), [])
+
+        self.assertGraphEqual(view, directed_graph([]))
+
+    def test_merge_views(self):
+        graph = make_test_graph()
+
+        def view(names, with_edges):
+            return GraphView(graph, indices_of(graph, names), with_edges)
+
+        merged = merge_views([
+            view(["D"], False),
+            view(["B", "C"], False)
+        ])
+
+        self.assertListEqual(merged.names, ["D", "B", "C"])
+        self.assertFalse(merged.with_edges)
+        self.assertGraphEqual(
+            merged,
+            directed_graph(
+                [],
+                ["D", "B", "C"],
+                pick_keys(["C"], vertex_props_dict).items()
+            )
+        )
+
+        merged = merge_views([
+            view(["D"], False),
+            view(["B", "C"], True)
+        ])
+
+        self.assertTrue(merged.with_edges)
+        self.assertGraphEqual(
+            merged,
+            directed_graph(
+                [("B", "C")],
+                ["D"],
+                pick_keys(["C"], vertex_props_dict).items()
+            )
+        )
+
+        # Edges between the views (A -> B), or edges of a view without
+        # edges (A -> D), are not edges of the disjoint union.
+        self.assertIsNone(merge_views([
+            view(["A"], True),
+            view(["B", "C"], True)
+        ]))
+        self.assertIsNone(merge_views([
+            view(["A", "D"], False),
+            view(["B", "C"], True)
+        ]))
+
+        # Vertices in more than one view, or repeated in a view.
+        self.assertIsNone(merge_views([
+            view(["B"], False),
+            view(["B", "C"], False)
+        ]))
+        self.assertIsNone(merge_views([view(["C", "C"], False)]))
+
+    def test_view_edges(self):
+        graph = make_test_graph()
+        view = GraphView(
+            graph,
+            indices_of(graph, ["C", "A", "B"]),
+            with_edges=False
+        )
+
+        self.assertListEqual(sorted(view_edges(view)), [(1, 2), (2, 0)])
+
+    def test_view_adjacency(self):
+        graph = make_test_graph()
+        view = GraphView(graph, indices_of(graph, ["C", "A", "B"]))
+
+        self.assertListEqual(view_adjacency(view), [[], [2], [0]])
+
+        self.assertListEqual(
+            view_adjacency(GraphView(graph, view.indices, with_edges=False)),
+            [[], [], []]
+        )
+
+    def test_without_edges_into(self):
+        graph = make_test_graph()
+        # A -> B -> C, A -> D, without edges into B.
+        view = GraphView(
+            graph,
+            indices_of(graph, ["A", "B", "C", "D"])
+        ).without_edges_into([1])
+
+        self.assertFalse(view.covers_graph())
+        self.assertListEqual(view_adjacency(view), [[3], [2], [], []])
+        self.assertListEqual(
+            view_adjacency(view, mode="in"),
+            [[], [], [1], [0]]
+        )
+        self.assertListEqual(sorted(view_edges(view)), [(0, 3), (1, 2)])
+        self.assertGraphEqual(
+            view,
+            directed_graph(
+                [("A", "D"), ("B", "C")],
+                None,
+                vertex_props_dict.items()
+            )
+        )
+
+        # Views of the view don't have the edges either.
+        self.assertListEqual(
+            view_adjacency(view.select([0, 1])),
+            [[], []]
+        )
+        self.assertEqual(view.select([0, 3]).excluded_targets, frozenset())
+
+    def test_reachable(self):
+        # 0 -> 1 -> 2 -> 3, 4 -> 2
+        successors = [[1], [2], [3], [], [2]]
+
+        self.assertEqual(reachable(successors, [1]), b"\0\1\1\1\0")
+        self.assertEqual(reachable(successors, []), b"\0\0\0\0\0")
+        self.assertEqual(
+            reachable(successors, [0, 4], excluded=b"\0\0\1\0\0"),
+            b"\1\1\0\0\1"
+        )
+        # Excluded sources are not reached.
+        self.assertEqual(
+            reachable(successors, [1, 4], excluded=b"\0\1\0\0\0"),
+            b"\0\0\1\1\1"
+        )
+
+    def test_find_many(self):
+        graph = make_test_graph()
+        view = GraphView(graph, indices_of(graph, ["C", "A", "B"]))
+
+        self.assertListEqual(
+            find_many(graph, ["D", "X", "A"]),
+            indices_of(graph, ["D", "A"])
+        )
+        # Positions in the view, names of vertices not in the view are
+        # skipped.
+        self.assertListEqual(find_many(view, ["B", "D", "X", "C"]), [2, 0])
+        self.assertListEqual(find_many(view, []), [])
+
+        # The name index is shared by all views of the graph (created by
+        # the package).
+        graph = owned_graph(graph)
+        self.assertIs(name_index(graph), name_index(graph))
+        self.assertIs(
+            name_index(view.select([0]).graph),
+            name_index(graph)
+        )
+
+    def test_modified_graph(self):
+        graph = make_test_graph()
+        view_adjacency(GraphView(graph, range(graph.vcount())))
+        find_many(graph, ["A"])
+
+        # Graphs given by callers might be modified between calls.
+        graph.add_vertex("E")
+        graph.add_edge("D", "E")
+        graph.vs[graph.vs.find(name="A").index]["name"] = "Z"
+
+        self.assertListEqual(
+            find_many(graph, ["E", "A", "Z"]),
+            indices_of(graph, ["E", "Z"])
+        )
+        self.assertIsNone(find_vertex_by_name_or_none(graph, "A"))
+        self.assertEqual(find_vertex_by_name_or_none(graph, "Z")["name"], "Z")
+        self.assertListEqual(
+            view_adjacency(GraphView(graph, range(graph.vcount()))),
+            graph.get_adjlist()
+        )
+
+        # Same number of vertices and edges, but with an edge rewired.
+        graph = directed_graph([("A", "B"), ("C", "D")])
+        self.assertListEqual(subcomponent_multi(graph, [0]), [0, 1])
+
+        graph.delete_edges([(0, 1)])
+        graph.add_edge(0, 3)
+
+        self.assertListEqual(subcomponent_multi(graph, [0]), [0, 3])
+
+    def test_owned_graph(self):
+        graph = owned_graph(make_test_graph())
+
+        self.assertIs(adjacency(graph), adjacency(graph))
+        self.assertIsNot(
+            adjacency(make_test_graph()),
+            adjacency(make_test_graph())
+        )
+
+        # Graphs given by callers are only cached within frozen_graph.
+        graph = make_test_graph()
+        with frozen_graph(GraphView(graph, [0])):
+            self.assertIs(adjacency(graph), adjacency(graph))
+        self.assertIsNot(adjacency(graph), adjacency(graph))
@@ -0,0 +1,228 @@
+import collections as collections
+
+from .flatten_references_graph import input_graph, input_key
+from .graph_view import as_view, is_graph_or_view, view_adjacency
+from .lib import debug, subcomponent_multi
+from .pipe import compile_pipeline
+from .popularity_contest import (
+    adjacency_popularity,
+    indices_by_popularity,
+    popularity_contest,
+    single_vertex_views
+)
+from .stage_cache import DEFAULT_MAX_ENTRIES, StageCache
+
+# Incremental re-layering: when a graph differs from the previous one by a
+# handful of paths (e.g. a single package bump), popularity (by far the most
+# expensive part of the pipeline, see popularity_contest.graph_popularity) is
+# only recomputed for the vertices it might have changed for.
+#
+# Popularity of a vertex depends only on the subgraph of its ancestors (and
+# the vertex itself): the number of paths from the roots to every ancestor.
+# That subgraph is determined by the parents of the vertex, the parents of
+# its parents, and so on. So if the set of parents (by name) of every
+# ancestor of a vertex is the same as in the previous graph, the popularity
+# of the vertex is the same too. The vertices for which popularity has to be
+# recomputed are therefore the descendants (including themselves) of the
+# vertices with a different set of parents (or which are new). Popularity of
+# those is computed from the subgraph of their ancestors, which contains all
+# the vertices it depends on (summing up popularity, the expensive part, is
+# skipped for the unaffected ancestors). Every other vertex gets its previous
+# popularity, so the result is always the same as of a full recompute.
+#
+# Other stages are linear in the size of the graph (and cheaper than
+# comparing graphs), so they are simply recomputed, unless their input is
+# the same as before (see stage_cache.py).
+
+DEFAULT_MAX_AFFECTED_FRACTION = 0.5
+
+DEFAULT_MAX_RECORDS = 16
+
+
+class PopularityRecord:
+    """Parents (frozenset of names) and popularity of all vertices of a graph
+    popularity was computed for, by name.
+    """
+
+    __slots__ = ("parents", "popularity")
+
+    def __init__(self, parents, popularity):
+        self.parents = parents
+        self.popularity = popularity
+
+
+def parents_by_name(view, names):
+    return {
+        name: frozenset(
+            names[parent] for parent in parents if parent != position
+        )
+        for (position, (name, parents)) in enumerate(
+            zip(names, view_adjacency(view, mode="in"))
+        )
+    }
+
+
+class Relayering(StageCache):
+    """State of incremental re-layering (see flatten_references_graph): a
+    stage cache, which also keeps the previous input graph and layers, and
+    the popularity computed by popularity_contest stages for recent graphs.
+
+    Popularity is computed from scratch if more than max_affected_fraction of
+    vertices of the graph are affected by the changes (a full computation is
+    cheaper then).
+
+    The state can also be created from a previous input and its result (see
+    from_previous), e.g. when they are read from files by separate runs.
+    """
+
+    def __init__(
+        self,
+        max_affected_fraction=DEFAULT_MAX_AFFECTED_FRACTION,
+        max_records=DEFAULT_MAX_RECORDS,
+        max_entries=DEFAULT_MAX_ENTRIES
+    ):
+        super().__init__(max_entries)
+        self.max_affected_fraction = max_affected_fraction
+        self.records = collections.deque(maxlen=max_records)
+        # Key of the previous input (see flatten_references_graph), and the
+        # resulting layers.
+        self.input_key = None
+        self.layers = None
+        # Numbers of vertices with popularity recomputed and reused.
+        self.recomputed = 0
+        self.reused = 0
+        # Graph (or view) popularity is recorded for when it's first needed
+        # (see from_previous).
+        self.pending_graph = None
+
+    @classmethod
+    def from_previous(
+        cls,
+        references_graph,
+        pipeline,
+        layers,
+        exclude_paths=None,
+        **options
+    ):
+        """Return Relayering with the state after flatten_references_graph
+        was applied to the given input and returned layers.
+
+        Popularity is not part of the result, so it's computed for the
+        previous graph when popularity of a (changed) graph is first needed.
+        If the input is the same, the layers are returned straight away.
+        """
+        relayering = cls(**options)
+        graph = input_graph(references_graph, exclude_paths)
+
+        relayering.input_key = input_key(compile_pipeline(pipeline), graph)
+        relayering.layers = [list(layer) for layer in layers]
+        relayering.pending_graph = graph
+
+        return relayering
+
+    def get_or_compute(self, stage, func, data):
+        if stage[0] == "popularity_contest" and is_graph_or_view(data):
+            func = self.popularity_contest
+
+        return super().get_or_compute(stage, func, data)
+
+    def closest_record(self, names):
+        """Return record with the most names in common with names, or None
+        if there are no records.
+        """
+        with self.lock:
+            (pending_graph, self.pending_graph) = (self.pending_graph, None)
+
+        if pending_graph is not None:
+            view = as_view(pending_graph)
+            popularity = adjacency_popularity(view_adjacency(view))
+            if popularity is not None:
+                self.record(view, view.names, popularity)
+
+        with self.lock:
+            records = list(self.records)
+
+        return max(
+            records,
+            key=lambda record: sum(
+                1 for name in names if name in record.popularity
+            ),
+            default=None
+        )
+
+    def popularity(self, view, names, parents):
+        """Return list of popularities of vertices of the view, or None if
+        the graph contains a cycle.
+        """
+        record = self.closest_record(names)
+
+        if record is not None:
+            changed = [
+                position for (position, name) in enumerate(names)
+                if record.parents.get(name) != parents[name]
+            ]
+            affected = subcomponent_multi(view, changed)
+
+            debug("changed", len(changed), "affected", len(affected))
+
+            if len(affected) <= self.max_affected_fraction * len(names):
+                # Ancestors of affected vertices (including them).
+                ancestors = subcomponent_multi(view, affected, mode="in")
+                is_affected = frozenset(affected)
+                ancestors_popularity = adjacency_popularity(
+                    view_adjacency(view.select(ancestors)),
+                    wanted=bytearray(
+                        position in is_affected for position in ancestors
+                    )
+                )
+
+                if ancestors_popularity is None:
+                    return None
+
+                popularity = [record.popularity.get(name) for name in names]
+                for (position, value) in zip(ancestors, ancestors_popularity):
+                    if value is not None:
+                        popularity[position] = value
+
+                with self.lock:
+                    self.recomputed += len(affected)
+                    self.reused += len(names) - len(affected)
+
+                return popularity
+
+        with self.lock:
+            self.recomputed += len(names)
+
+        return adjacency_popularity(view_adjacency(view))
+
+    def record(self, view, names, popularity, parents=None):
+        """Record popularity of vertices of the view (with given names and
+        parents, see parents_by_name).
+        """
+        if parents is None:
+            parents = parents_by_name(view, names)
+
+        with self.lock:
+            self.records.append(
+                PopularityRecord(parents, dict(zip(names, popularity)))
+            )
+
+    def popularity_contest(self, graph):
+        """Same as popularity_contest.popularity_contest (for graphs and
+        views), reusing popularity computed for similar graphs.
+        """
+        view = as_view(graph)
+        names = view.names
+        parents = parents_by_name(view, names)
+        popularity = self.popularity(view, names, parents)
+
+        if popularity is None:
+            # Cycles are handled by the original algorithm.
+            return popularity_contest(view)
+
+        self.record(view, names, popularity, parents)
+
+        return single_vertex_views(
+            view,
+            indices_by_popularity(names, popularity)
+        )
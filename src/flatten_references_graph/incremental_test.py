@@ -0,0 +1,165 @@
+import unittest
+
+from .flatten_references_graph import flatten_references_graph
+from .incremental import Relayering
+from .lib import (
+    load_json,
+    path_relative_to_file
+)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+def load_real_references_graph():
+    return load_json(path_relative_to_file(
+        __file__,
+        "__test_fixtures/real-references-graph.json"
+    ))
+
+
+def with_new_dependency(nodes, path, dependency):
+    """Return nodes with a new node (referencing dependency) referenced by
+    the node with the given path.
+    """
+    return [
+        (
+            dict(node, references=node["references"] + ["new-dependency"])
+            if node["path"] == path else node
+        )
+        for node in nodes
+    ] + [
+        {
+            "closureSize": 1,
+            "narSize": 1,
+            "path": "new-dependency",
+            "references": [dependency]
+        }
+    ]
+
+
+def without_node(nodes, path):
+    return [
+        dict(
+            node,
+            references=[
+                reference for reference in node["references"]
+                if reference != path
+            ]
+        )
+        for node in nodes
+        if node["path"] != path
+    ]
+
+
+pipeline = [
+    ["popularity_contest"],
+    ["limit_layers", 20]
+]
+
+
+class Test(unittest.TestCase):
+
+    def test_same_result_as_full_recompute(self):
+        nodes = load_real_references_graph()
+        referenced = frozenset(
+            reference
+            for node in nodes
+            for reference in node["references"]
+            if reference != node["path"]
+        )
+        [root, *_] = [
+            node["path"] for node in nodes if node["path"] not in referenced
+        ]
+        leaf = next(
+            node["path"] for node in nodes
+            if node["references"] in ([], [node["path"]])
+        )
+
+        previous = Relayering()
+
+        for graph in [
+            nodes,
+            with_new_dependency(nodes, root, leaf),
+            without_node(nodes, leaf),
+            nodes
+        ]:
+            self.assertListEqual(
+                flatten_references_graph(graph, pipeline, previous=previous),
+                flatten_references_graph(graph, pipeline)
+            )
+
+        self.assertGreater(previous.reused, 0)
+
+    def test_unchanged_graph(self):
+        nodes = load_real_references_graph()
+        previous = Relayering()
+
+        result = flatten_references_graph(nodes, pipeline, previous=previous)
+        recomputed = previous.recomputed
+        misses = previous.misses
+
+        self.assertListEqual(
+            flatten_references_graph(nodes, pipeline, previous=previous),
+            result
+        )
+        self.assertEqual(previous.recomputed, recomputed)
+        self.assertEqual(previous.misses, misses)
+
+        # A different pipeline is applied.
+        self.assertListEqual(
+            flatten_references_graph(
+                nodes,
+                [["popularity_contest"], ["limit_layers", 2]],
+                previous=previous
+            ),
+            flatten_references_graph(
+                nodes,
+                [["popularity_contest"], ["limit_layers", 2]]
+            )
+        )
+
+    def test_fallback(self):
+        nodes = load_real_references_graph()
+        previous = Relayering(max_affected_fraction=0)
+
+        flatten_references_graph(nodes, pipeline, previous=previous)
+        changed = without_node(nodes, nodes[0]["path"])
+
+        self.assertListEqual(
+            flatten_references_graph(changed, pipeline, previous=previous),
+            flatten_references_graph(changed, pipeline)
+        )
+        self.assertEqual(previous.reused, 0)
+
+    def test_stage_cache_and_previous(self):
+        with self.assertRaises(ValueError):
+            flatten_references_graph(
+                [],
+                pipeline,
+                stage_cache=Relayering(),
+                previous=Relayering()
+            )
+
+    def test_from_previous(self):
+        nodes = load_real_references_graph()
+        layers = flatten_references_graph(nodes, pipeline)
+
+        previous = Relayering.from_previous(nodes, pipeline, layers)
+
+        self.assertListEqual(
+            flatten_references_graph(nodes, pipeline, previous=previous),
+            layers
+        )
+        self.assertEqual(previous.misses, 0)
+        self.assertEqual(previous.recomputed, 0)
+
+        previous = Relayering.from_previous(nodes, pipeline, layers)
+        changed = without_node(nodes, nodes[0]["path"])
+
+        self.assertListEqual(
+            flatten_references_graph(changed, pipeline, previous=previous),
+            flatten_references_graph(changed, pipeline)
+        )
+        self.assertGreater(previous.reused, 0)
@@ -0,0 +1,92 @@
+import json as json
+from json.encoder import encode_basestring_ascii
+
+# Serialisation of results (nested lists of paths) into JSON, producing
+# exactly the same text as
+#   json.dumps(result, sort_keys=True, indent=2, separators=(",", ": "))
+# (or, in compact mode, as json.dumps(result, separators=(",", ":"))), but
+# incrementally: a chunk per innermost list (layer), with all paths of a layer
+# encoded by the (C implemented) string encoder of the json module and joined
+# at once.
+
+INDENT = "  "
+
+
+def is_list(value):
+    return isinstance(value, (list, tuple))
+
+
+def encode_leaf(value):
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+
+    if isinstance(value, dict) or is_list(value):
+        raise TypeError(f"Unsupported value in result: {value!r}")
+
+    return json.dumps(value)
+
+
+def encode_layer(separator, value):
+    """Return encoded strings of value joined with separator, or None if
+    not all elements of value are strings.
+    """
+    try:
+        return separator.join(map(encode_basestring_ascii, value))
+    except TypeError:
+        return None
+
+
+def iter_indented(value, depth):
+    if not is_list(value):
+        yield encode_leaf(value)
+        return
+
+    if len(value) == 0:
+        yield "[]"
+        return
+
+    inner_indent = "\n" + INDENT * (depth + 1)
+
+    layer = encode_layer("," + inner_indent, value)
+    if layer is not None:
+        yield "[" + inner_indent + layer + "\n" + INDENT * depth + "]"
+        return
+
+    yield "[" + inner_indent
+    for (index, item) in enumerate(value):
+        if index > 0:
+            yield "," + inner_indent
+        yield from iter_indented(item, depth + 1)
+    yield "\n" + INDENT * depth + "]"
+
+
+def iter_compact(value):
+    if not is_list(value):
+        yield encode_leaf(value)
+        return
+
+    layer = encode_layer(",", value)
+    if layer is not None:
+        yield "[" + layer + "]"
+        return
+
+    yield "["
+    for (index, item) in enumerate(value):
+        if index > 0:
+            yield ","
+        yield from iter_compact(item)
+    yield "]"
+
+
+def iter_result_chunks(result, compact=False):
+    return iter_compact(result) if compact else iter_indented(result, 0)
+
+
+def format_result(result, compact=False):
+    return "".join(iter_result_chunks(result, compact))
+
+
+def write_result(f, result, compact=False):
+    """Write result to the text file f incrementally (see format_result)."""
+    for chunk in iter_result_chunks(result, compact):
+        f.write(chunk)
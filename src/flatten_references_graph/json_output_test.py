@@ -0,0 +1,67 @@
+import io
+import json
+import random
+import unittest
+
+from .json_output import (
+    format_result,
+    write_result
+)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+def random_path(rng):
+    return "/nix/store/" + "".join(
+        rng.choice('abc-_"\\\n\tzß€😀') for _ in range(rng.randint(0, 12))
+    )
+
+
+def random_result(rng, depth):
+    if depth == 0:
+        return random_path(rng)
+
+    return [
+        random_result(rng, depth - 1) for _ in range(rng.randint(0, 4))
+    ]
+
+
+class Test(unittest.TestCase):
+
+    def test_same_as_json_dumps(self):
+        rng = random.Random(0)
+
+        for _ in range(200):
+            # Results of batch mode are one level deeper.
+            result = random_result(rng, rng.choice([2, 3]))
+
+            self.assertEqual(
+                format_result(result),
+                json.dumps(
+                    result,
+                    sort_keys=True,
+                    indent=2,
+                    separators=(",", ": ")
+                )
+            )
+            self.assertEqual(
+                format_result(result, compact=True),
+                json.dumps(result, separators=(",", ":"))
+            )
+
+            f = io.StringIO()
+            write_result(f, result)
+            self.assertEqual(f.getvalue(), format_result(result))
+
+    def test_mixed(self):
+        result = [["A", ["B", []]], [], "C", [1, None]]
+
+        self.assertEqual(
+            format_result(result),
+            json.dumps(result, indent=2, separators=(",", ": "))
+        )
+
+        with self.assertRaises(TypeError):
+            format_result([{"a": 1}])
@@ -0,0 +1,144 @@
+import json as json
+
+# Incremental parsing of JSON documents which are too big to be comfortably
+# loaded with json.load. Only the top level object (and arrays which are
+# values of selected keys of that object) are parsed incrementally, all other
+# values are parsed with the standard json decoder, one at a time.
+
+decoder = json.JSONDecoder()
+
+WHITESPACE = " \t\n\r"
+
+NUMBER_CHARS = "0123456789.eE+-"
+
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+
+class Reader:
+    """Buffered reader of JSON values from a text file."""
+
+    def __init__(self, f, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def fill(self):
+        # Read at least as much as is already buffered (and not consumed), so
+        # that values spanning many chunks are parsed in linear time.
+        chunk = self.f.read(
+            max(self.chunk_size, len(self.buffer) - self.position)
+        )
+
+        if chunk == "":
+            self.eof = True
+        else:
+            self.buffer = self.buffer[self.position:] + chunk
+            self.position = 0
+
+    def peek(self):
+        """Skip whitespace and return next character ("" at the end of the
+        file) without consuming it.
+        """
+        while True:
+            while (
+                self.position < len(self.buffer) and
+                self.buffer[self.position] in WHITESPACE
+            ):
+                self.position += 1
+
+            if self.position < len(self.buffer) or self.eof:
+                return self.buffer[self.position:self.position + 1]
+
+            self.fill()
+
+    def expect(self, chars):
+        char = self.peek()
+
+        if char == "" or char not in chars:
+            raise ValueError(
+                f"Expected one of {list(chars)}, got {char!r} at position "
+                f"{self.position} of the current buffer"
+            )
+
+        self.position += 1
+        return char
+
+    def value(self):
+        self.peek()
+
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self.fill()
+                continue
+
+            # Numbers at the end of the buffer might continue in the next
+            # chunk (and "1." for example is decoded as 1, so the end of the
+            # decoded value is not necessarily the end of the buffer).
+            if not self.eof and (
+                end == len(self.buffer) or
+                self.buffer[end] in NUMBER_CHARS
+            ):
+                self.fill()
+                continue
+
+            self.position = end
+            return value
+
+
+def iter_array(reader):
+    reader.expect("[")
+
+    if reader.peek() == "]":
+        reader.expect("]")
+        return
+
+    while True:
+        yield reader.value()
+
+        if reader.expect(",]") == "]":
+            return
+
+
+def iter_object_items(f, streamed_keys=(), chunk_size=DEFAULT_CHUNK_SIZE):
+    """Parse a JSON object from a text file incrementally, yielding
+    (key, value) pairs.
+
+    Values of keys in streamed_keys need to be arrays, and are yielded as
+    iterators over their elements, which are parsed lazily. Such iterator
+    needs to be consumed before requesting the next pair (any elements left
+    are skipped otherwise).
+
+    Apart from chunk_size characters of input, only a single value (or array
+    element) is held in memory at a time.
+    """
+    reader = Reader(f, chunk_size)
+
+    reader.expect("{")
+
+    if reader.peek() == "}":
+        reader.expect("}")
+    else:
+        while True:
+            key = reader.value()
+            reader.expect(":")
+
+            if key in streamed_keys:
+                elements = iter_array(reader)
+                yield key, elements
+                # Skip elements which were not consumed.
+                for _ in elements:
+                    pass
+            else:
+                yield key, reader.value()
+
+            if reader.expect(",}") == "}":
+                break
+
+    if reader.peek() != "":
+        raise ValueError("Unexpected data after the end of JSON object")
@@ -0,0 +1,107 @@
+import io
+import json
+import unittest
+
+from .json_stream import iter_object_items
+from .lib import path_relative_to_file
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+def load_fixture_text():
+    file_path = path_relative_to_file(
+        __file__,
+        "__test_fixtures/flatten-references-graph-main-input.json"
+    )
+
+    with open(file_path) as f:
+        return f.read()
+
+
+class Test(unittest.TestCase):
+
+    def test_same_as_json_load(self):
+        text = load_fixture_text()
+
+        for chunk_size in [1, 2, 7, 64, 1 << 16]:
+            result = dict(iter_object_items(
+                io.StringIO(text),
+                chunk_size=chunk_size
+            ))
+
+            self.assertDictEqual(result, json.loads(text))
+
+    def test_streamed_keys(self):
+        text = load_fixture_text()
+        expected = json.loads(text)
+
+        for chunk_size in [1, 5, 1 << 16]:
+            result = {}
+            for (key, value) in iter_object_items(
+                io.StringIO(text),
+                streamed_keys=["graph"],
+                chunk_size=chunk_size
+            ):
+                if key == "graph":
+                    self.assertNotIsInstance(value, list)
+                    value = list(value)
+                result[key] = value
+
+            self.assertDictEqual(result, expected)
+
+    def test_streamed_keys_not_consumed(self):
+        text = '{"a": [1, [2], {"b": 3}], "c": 1.5e3, "d": [], "e": true}'
+
+        self.assertListEqual(
+            [
+                key for (key, _) in iter_object_items(
+                    io.StringIO(text),
+                    streamed_keys=["a", "d"],
+                    chunk_size=3
+                )
+            ],
+            ["a", "c", "d", "e"]
+        )
+
+        result = dict(
+            (key, list(value) if key == "d" else value)
+            for (key, value) in iter_object_items(
+                io.StringIO(text),
+                streamed_keys=["a", "d"],
+                chunk_size=3
+            )
+            if key != "a"
+        )
+
+        self.assertDictEqual(result, {"c": 1500.0, "d": [], "e": True})
+
+    def test_empty_object(self):
+        self.assertListEqual(
+            list(iter_object_items(io.StringIO(" { } \n"))),
+            []
+        )
+
+    def test_invalid(self):
+        def parse(text):
+            return [
+                (key, list(value) if key == "a" else value)
+                for (key, value) in iter_object_items(
+                    io.StringIO(text),
+                    streamed_keys=["a"],
+                    chunk_size=2
+                )
+            ]
+
+        for text in [
+            '',
+            '[]',
+            '{"a": {}}',
+            '{"a": [1, 2}',
+            '{"b": 1,}',
+            '{"b": 1} {}',
+            '{"b": tru}',
+        ]:
+            with self.assertRaises(ValueError, msg=text):
+                parse(text)
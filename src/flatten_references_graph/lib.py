@@ -1,21 +1,30 @@
+from array import array
 from collections.abc import Iterable
 from pathlib import Path
 from toolz import curried as tlz
 from toolz import curry
 import igraph as igraph
 import itertools as itertools
-import json as json
-import os as os
 import re as re
-import sys
 
-DEBUG = os.environ.get("DEBUG", False) == "True"
-DEBUG_PLOT = os.environ.get("DEBUG_PLOT", False) == "True"
-
-
-def debug(*args, **kwargs):
-    if DEBUG:
-        print(*args, file=sys.stderr, **kwargs)
+from .graph_view import (
+    GraphView,
+    as_graph,
+    as_view,
+    find_many,
+    is_view,
+    merge_views,
+    owned_graph,
+    reachable,
+    vertex_names,
+    view_adjacency
+)
+
+from .util import (
+    DEBUG_PLOT,
+    debug,
+    load_json
+)
 
 
 def debug_plot(g, **kwargs):
@@ -67,11 +76,6 @@ def unnest_iterable(xs):
     return itertools.chain.from_iterable(xs)
 
 
-def load_json(file_path):
-    with open(file_path) as f:
-        return json.load(f)
-
-
 @curry
 def sorted_by(key, xs):
     return sorted(xs, key=lambda x: x[key])
@@ -81,36 +85,24 @@ def sorted_by(key, xs):
 def find_vertex_by_name_or_none(graph, name):
     try:
         # NOTE: find by name is constant time.
-        return graph.vs.find(name)
+        return graph.vs.find(name=name)
     # This will be thrown if vertex with given name is not found.
     except ValueError:
         return None
 
 
 def subcomponent_multi(graph, vertices, mode="out"):
-    """Return concatenated subcomponents generated by the given list of
-    vertices.
-    """
-    return tlz.mapcat(
-        lambda vertex: graph.subcomponent(vertex, mode=mode),
-        vertices
-    )
+    """Return sorted list of (distinct) vertices reachable from any of the
+    given vertices (including them), following edges in the given direction
+    (see graph.subcomponent).
 
+    graph can be a view, vertices are then positions in the view.
 
-@curry
-def egdes_for_reference_graph_node(path_to_size_dict, reference_graph_node):
-    source = reference_graph_node["path"]
-    return map(
-        lambda x: {"source": source, "target": x},
-        sorted(
-            filter(
-                # references might contain source
-                lambda x: x != source,
-                reference_graph_node["references"]
-            ),
-            key=lambda x: 1 * path_to_size_dict[x]
-        )
-    )
+    All vertices are traversed at once, so every vertex is visited at most
+    once, even if it's reachable from many of the given vertices.
+    """
+    reached = reachable(view_adjacency(as_view(graph), mode), vertices)
+    return list(itertools.compress(range(len(reached)), reached))
 
 
 reference_graph_node_keys_to_keep = [
@@ -121,38 +113,132 @@ reference_graph_node_keys_to_keep = [
 pick_reference_graph_node_keys = pick_keys(reference_graph_node_keys_to_keep)
 
 
-def vertex_from_reference_graph_node(reference_graph_node):
-    return tlz.merge(
-        {"name": reference_graph_node["path"]},
-        pick_reference_graph_node_keys(reference_graph_node)
-    )
-
-
 def references_graph_to_igraph(references_graph):
     """
     Converts result of exportReferencesGraph into an igraph directed graph.
     Uses paths as igraph node names, and sets closureSize and narSize as
     properties of igraph nodes.
-    """
-    debug('references_graph', references_graph)
-    references_graph = sorted(references_graph, key=lambda x: 1 * x["narSize"])
 
-    path_to_size_dict = {
-        node["path"]: node["narSize"] for node in references_graph
-    }
+    Vertices are sorted by narSize, and edges of every vertex by narSize of
+    their targets (both sorts are stable).
+
+    references_graph can be any iterable of nodes (e.g. a generator yielding
+    nodes as they are parsed, see json_stream.py), and is consumed in a
+    single pass, without keeping the nodes. Every path is interned to an
+    integer id the first time it's seen, and only the following is kept for
+    the graph being built:
+      - a list of paths and a dict mapping paths to ids,
+      - narSize and closureSize of every node,
+      - an array of references (as ids) of all nodes, plus offsets into it.
+    The graph is then created from a list of integer edges and a list of
+    values per vertex attribute.
+
+    Peak memory is therefore bounded by
+      O(V * (average path length + ~200 bytes) + E * 8 bytes)
+    plus the size of the largest single node, where V is the number of paths
+    and E the number of references.
+    """
+    ids = {}
+    paths = []
+
+    def intern(path):
+        path_id = ids.get(path)
+        if path_id is None:
+            path_id = ids[path] = len(paths)
+            paths.append(path)
+        return path_id
+
+    node_ids = array("q")
+    attrs = {key: [] for key in reference_graph_node_keys_to_keep}
+    reference_offsets = array("q", [0])
+    references = array("q")
+
+    for node in references_graph:
+        node_id = intern(node["path"])
+        node_ids.append(node_id)
+
+        for (key, values) in attrs.items():
+            values.append(node.get(key))
+
+        references.extend(
+            intern(reference) for reference in node["references"]
+            # references might contain source
+            if reference != node["path"]
+        )
+        reference_offsets.append(len(references))
 
-    debug('path_to_size_dict', path_to_size_dict)
+    # Not needed anymore.
+    ids.clear()
 
-    return igraph.Graph.DictList(
-        map(vertex_from_reference_graph_node, references_graph),
-        unnest_iterable(map(
-            egdes_for_reference_graph_node(path_to_size_dict),
-            references_graph
-        )),
-        directed=True
+    return columns_to_igraph(
+        paths,
+        node_ids,
+        attrs,
+        reference_offsets,
+        references
     )
 
 
+def columns_to_igraph(paths, node_ids, attrs, reference_offsets, references):
+    """Create igraph graph (see references_graph_to_igraph) from columns
+    describing nodes of a references graph, where paths are represented by
+    integer ids:
+      - paths: list of paths by id,
+      - node_ids: sequence of path ids of nodes,
+      - attrs: dict mapping names of attributes (see
+        reference_graph_node_keys_to_keep) to lists of values for all nodes,
+      - reference_offsets and references: ids of paths referenced by node i
+        are references[reference_offsets[i]:reference_offsets[i + 1]] (these
+        can be arrays or memoryviews, and are not copied).
+
+    Raises KeyError if a referenced path is not a node.
+    """
+    node_count = len(node_ids)
+
+    # Stable sort by narSize.
+    order = sorted(range(node_count), key=attrs["narSize"].__getitem__)
+
+    vertex_index_by_id = [None] * len(paths)
+    nar_size_by_id = [None] * len(paths)
+    for (vertex_index, node_index) in enumerate(order):
+        node_id = node_ids[node_index]
+        vertex_index_by_id[node_id] = vertex_index
+        nar_size_by_id[node_id] = attrs["narSize"][node_index]
+
+    for (path_id, vertex_index) in enumerate(vertex_index_by_id):
+        if vertex_index is None:
+            # Referenced path which is not in the graph.
+            raise KeyError(paths[path_id])
+
+    def edges():
+        for node_index in order:
+            source = vertex_index_by_id[node_ids[node_index]]
+            targets = references[
+                reference_offsets[node_index]:
+                reference_offsets[node_index + 1]
+            ]
+
+            for target in sorted(targets, key=nar_size_by_id.__getitem__):
+                yield (source, vertex_index_by_id[target])
+
+    vertex_attrs = {
+        key: [values[node_index] for node_index in order]
+        for (key, values) in attrs.items()
+        # Only add attributes present in the input.
+        if any(map(not_None, values))
+    }
+
+    return owned_graph(igraph.Graph(
+        n=node_count,
+        edges=list(edges()),
+        directed=True,
+        vertex_attrs=tlz.merge(
+            {"name": [paths[node_ids[node_index]] for node_index in order]},
+            vertex_attrs
+        )
+    ))
+
+
 @curry
 def graph_vertex_index_to_name(graph, index):
     return graph.vs[index]["name"]
@@ -197,7 +283,7 @@ def print_layers(layers):
         debug("")
         debug("layer index:", index)
         debug("[")
-        for v in layer.vs["name"]:
+        for v in vertex_names(layer):
             debug("  ", v)
         debug("]")
 
@@ -229,7 +315,7 @@ def empty_directed_graph():
 
 
 def graph_is_empty(graph):
-    return len(graph.vs) == 0
+    return graph.vcount() == 0
 
 
 def pick_attrs(attrs, x):
@@ -237,7 +323,71 @@ def pick_attrs(attrs, x):
 
 
 def merge_graphs(graphs):
-    return tlz.reduce(lambda acc, g: acc + g, graphs)
+    graphs = list(graphs)
+
+    # Views of the same graph are merged without creating any graphs, where
+    # their disjoint union can be represented by a view (see merge_views).
+    if (
+        all(map(is_view, graphs)) and
+        len(frozenset(id(g.graph) for g in graphs)) == 1
+    ):
+        merged = merge_views(graphs)
+        if merged is not None:
+            return merged
+
+    return disjoint_union(list(map(as_graph, graphs)))
+
+
+def concat_attribute_values(attribute_names, seqs):
+    return {
+        name: list(unnest_iterable(
+            seq[name] if name in seq.attributes() else [None] * len(seq)
+            for seq in seqs
+        ))
+        for name in attribute_names
+    }
+
+
+def disjoint_union(graphs):
+    """Return disjoint union of given graphs, with vertices and edges in the
+    order of the given graphs, and their attributes preserved.
+
+    Same as adding the graphs one by one with +, but creates a single graph
+    (instead of a copy of the accumulated graph for every added graph).
+    """
+    if len(graphs) == 0:
+        return empty_directed_graph()
+
+    offsets = list(itertools.accumulate(
+        [0] + [g.vcount() for g in graphs[:-1]]
+    ))
+
+    def attribute_names(seqs):
+        # Preserves order in which the attributes are first found.
+        return list(dict.fromkeys(unnest_iterable(
+            seq.attributes() for seq in seqs
+        )))
+
+    vertex_seqs = [g.vs for g in graphs]
+    edge_seqs = [g.es for g in graphs]
+
+    return owned_graph(igraph.Graph(
+        n=sum(g.vcount() for g in graphs),
+        edges=[
+            (source + offset, target + offset)
+            for (g, offset) in zip(graphs, offsets)
+            for (source, target) in g.get_edgelist()
+        ],
+        directed=graphs[0].is_directed(),
+        vertex_attrs=concat_attribute_values(
+            attribute_names(vertex_seqs),
+            vertex_seqs
+        ),
+        edge_attrs=concat_attribute_values(
+            attribute_names(edge_seqs),
+            edge_seqs
+        )
+    ))
 
 
 # Functions below can be used in user defined pipeline (see pipe.py).
@@ -263,10 +413,10 @@ def flatten(xs):
 
 @curry
 def split_every(count, graph):
-    vs = graph.vs
+    view = as_view(graph)
     return [
-        graph.induced_subgraph(vs[x:x + count])
-        for x in range(0, len(vs), count)
+        view.select(range(x, min(x + count, view.vcount())))
+        for x in range(0, view.vcount(), count)
     ]
 
 
@@ -276,28 +426,122 @@ def limit_layers(max_count, graphs):
 
     graphs_iterator = iter(graphs)
 
+    def merge_remaining():
+        # Merges all graphs remaining in the iterator, after initial
+        # max_count - 1 have been taken (in one go, see merge_graphs).
+        remaining = list(graphs_iterator)
+        if len(remaining) > 0:
+            yield merge_graphs(remaining)
+
     return tlz.concat([
         tlz.take(max_count - 1, graphs_iterator),
-        # Merges all graphs remaining in the iterator, after initial
-        # max_count - 1 have been taken.
-        (lambda: (yield merge_graphs(graphs_iterator)))()
+        merge_remaining()
     ])
 
 
+def nar_size(graph):
+    """Return sum of narSize of all vertices of the graph (or view)."""
+    view = as_view(graph)
+
+    if "narSize" not in view.graph.vs.attributes():
+        return 0
+
+    return sum(
+        size or 0 for size in view.graph.vs.select(view.indices)["narSize"]
+    )
+
+
+def pack_layers(sizes, max_count, budget):
+    """Return lists of indices of items with given sizes, packed into at
+    most max_count layers of at most budget bytes (where possible).
+
+    Items are packed from the largest one, in the given order if they are
+    equally large (first fit decreasing): every item is put into the first
+    layer it fits into, or into a new layer if it doesn't fit into any of
+    them, or into the smallest layer if there are max_count layers already.
+
+    Items in every layer, and layers (by their first item), are in the given
+    order.
+    """
+    layers = []
+    layer_sizes = []
+
+    # Stable sort, so equally large items stay in the given order.
+    for index in sorted(range(len(sizes)), key=lambda i: -sizes[i]):
+        size = sizes[index]
+        layer = next(
+            (
+                layer for (layer, layer_size) in enumerate(layer_sizes)
+                if layer_size + size <= budget
+            ),
+            None
+        )
+
+        if layer is None and len(layers) < max_count:
+            layers.append([])
+            layer_sizes.append(0)
+            layer = len(layers) - 1
+        elif layer is None:
+            layer = min(range(len(layers)), key=layer_sizes.__getitem__)
+
+        layers[layer].append(index)
+        layer_sizes[layer] += size
+
+    return sorted(map(sorted, layers))
+
+
+@curry
+def pack_by_size(max_count, max_layer_size, graphs):
+    """Merge graphs into at most max_count layers of at most max_layer_size
+    bytes (by narSize), where possible.
+
+    Graphs are packed by size first (see pack_layers), so that layers are
+    balanced, and by their order (e.g. popularity order, see
+    popularity_contest) if equally large. If max_layer_size is None, it's
+    the total size divided by max_count, and if the total size is 0 (e.g.
+    without narSize in the input), graphs are packed by their count instead.
+    """
+    assert max_count > 0, "max count needs to > 0"
+
+    graphs = list(graphs)
+    sizes = list(map(nar_size, graphs))
+
+    if max_layer_size is None and sum(sizes) == 0:
+        sizes = [1] * len(sizes)
+
+    budget = (
+        -(-sum(sizes) // max_count) if max_layer_size is None
+        else max_layer_size
+    )
+
+    debug("pack_by_size budget", budget)
+
+    return [
+        merge_graphs(graphs[index] for index in layer)
+        for layer in pack_layers(sizes, max_count, budget)
+    ]
+
+
 @curry
 def remove_paths(paths, graph):
     # Allow passing a single path.
     if isinstance(paths, str):
         paths = [paths]
 
-    indices_to_remove = tlz.compose(
-        list,
-        tlz.map(lambda v: v.index),
-        tlz.remove(is_None),
-        tlz.map(find_vertex_by_name_or_none(graph))
-    )(paths)
+    view = as_view(graph)
+
+    # Indices of the base graph of the view.
+    indices_to_remove = frozenset(find_many(view.graph, paths))
 
-    return graph - indices_to_remove if len(indices_to_remove) > 0 else graph
+    return (
+        GraphView(
+            view.graph,
+            (i for i in view.indices if i not in indices_to_remove),
+            view.with_edges,
+            view.excluded_targets
+        )
+        if len(indices_to_remove) > 0 else view
+    )
 
 
 @curry
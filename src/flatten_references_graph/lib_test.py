@@ -1,15 +1,26 @@
+import igraph as igraph
 import unittest
 
 from toolz import curried as tlz
 
 from . import test_helpers as th
 
+from .graph_view import GraphView, vertex_names
 from .lib import (
     directed_graph,
+    disjoint_union,
     igraph_to_reference_graph,
+    limit_layers,
+    load_json,
+    nar_size,
+    pack_by_size,
+    path_relative_to_file,
     pick_keys,
     references_graph_to_igraph,
-    reference_graph_node_keys_to_keep
+    reference_graph_node_keys_to_keep,
+    remove_paths,
+    split_every,
+    subcomponent_multi
 )
 
 if __name__ == "__main__":
@@ -78,6 +89,36 @@ references_graph = [
 ]
 
 
+def dict_list_references_graph_to_igraph(references_graph):
+    """Previous implementation of references_graph_to_igraph, creating the
+    graph from a dict per vertex and per edge.
+    """
+    references_graph = sorted(references_graph, key=lambda x: x["narSize"])
+
+    path_to_size_dict = {
+        node["path"]: node["narSize"] for node in references_graph
+    }
+
+    return igraph.Graph.DictList(
+        [
+            tlz.merge(
+                {"name": node["path"]},
+                pick_keys(reference_graph_node_keys_to_keep, node)
+            )
+            for node in references_graph
+        ],
+        [
+            {"source": node["path"], "target": reference}
+            for node in references_graph
+            for reference in sorted(
+                (x for x in node["references"] if x != node["path"]),
+                key=path_to_size_dict.__getitem__
+            )
+        ],
+        directed=True
+    )
+
+
 class TestLib(unittest.TestCase, th.CustomAssertions):
 
     def test_references_graph_to_igraph(self):
@@ -153,6 +194,36 @@ class TestLib(unittest.TestCase, th.CustomAssertions):
             ["B", "C"]
         )
 
+    def test_references_graph_to_igraph_same_as_dict_list(self):
+        real_references_graph = load_json(path_relative_to_file(
+            __file__,
+            "__test_fixtures/real-references-graph.json"
+        ))
+
+        for nodes in [references_graph, real_references_graph]:
+            expected = dict_list_references_graph_to_igraph(nodes)
+            # Accepts any iterable.
+            result = references_graph_to_igraph(iter(nodes))
+
+            # Same vertex and edge order.
+            self.assertListEqual(result.vs["name"], expected.vs["name"])
+            self.assertListEqual(
+                result.get_edgelist(),
+                expected.get_edgelist()
+            )
+            self.assertListEqual(
+                sorted(result.vs.attributes()),
+                sorted(expected.vs.attributes())
+            )
+            for key in reference_graph_node_keys_to_keep:
+                self.assertListEqual(result.vs[key], expected.vs[key])
+
+    def test_references_graph_to_igraph_missing_node(self):
+        with self.assertRaises(KeyError):
+            references_graph_to_igraph([
+                {"path": "A", "narSize": 1, "references": ["B"]}
+            ])
+
     def test_igraph_to_reference_graph(self):
 
         graph = references_graph_to_igraph(references_graph)
@@ -187,3 +258,199 @@ class TestLib(unittest.TestCase, th.CustomAssertions):
                 sorted(node["references"]),
                 sorted(revove_self_ref(original_node["references"]))
             )
+
+    def test_split_every(self):
+        graph = directed_graph([("A", "B"), ("B", "C"), ("C", "D")], ["E"])
+
+        result = split_every(2, graph)
+
+        self.assertListEqual(
+            [layer.names for layer in result],
+            [["A", "B"], ["C", "D"], ["E"]]
+        )
+
+        for layer in result:
+            self.assertIs(layer.graph, graph)
+
+        self.assertGraphEqual(result[0], directed_graph([("A", "B")]))
+        self.assertGraphEqual(result[1], directed_graph([("C", "D")]))
+        self.assertGraphEqual(result[2], directed_graph([], ["E"]))
+
+        # Works with output of other stages.
+        self.assertListEqual(
+            [layer.names for layer in split_every(1, result[0])],
+            [["A"], ["B"]]
+        )
+
+    def test_subcomponent_multi(self):
+        graph = directed_graph(
+            [("A", "C"), ("B", "C"), ("C", "D"), ("B", "E")],
+            ["F"]
+        )
+
+        def names(indices):
+            return [graph.vs[index]["name"] for index in indices]
+
+        def indices(names):
+            return [graph.vs.find(name).index for name in names]
+
+        # Shared dependencies are returned once.
+        self.assertListEqual(
+            names(subcomponent_multi(graph, indices(["A", "B", "C"]))),
+            names(sorted(indices(["A", "B", "C", "D", "E"])))
+        )
+        self.assertListEqual(
+            names(subcomponent_multi(graph, indices(["D"]), mode="in")),
+            names(sorted(indices(["A", "B", "C", "D"])))
+        )
+        self.assertListEqual(subcomponent_multi(graph, []), [])
+
+        # Positions in a view.
+        view = remove_paths(["A", "C"], graph)
+        self.assertListEqual(
+            subcomponent_multi(view, [view.names.index("B")]),
+            [view.names.index("B"), view.names.index("E")]
+        )
+
+    def test_remove_paths(self):
+        graph = directed_graph([("A", "B"), ("B", "C")], ["D"])
+
+        result = remove_paths(["B", "D", "X"], graph)
+
+        self.assertIs(result.graph, graph)
+        self.assertGraphEqual(result, directed_graph([], ["A", "C"]))
+
+        # Single path
+        self.assertGraphEqual(
+            remove_paths("A", result),
+            directed_graph([], ["C"])
+        )
+
+        # Path not in the view
+        self.assertIs(remove_paths("B", result).graph, graph)
+        self.assertListEqual(remove_paths("B", result).names, ["A", "C"])
+
+    def test_disjoint_union(self):
+        graphs = [
+            directed_graph([("A", "B")], None, [("A", {"narSize": 1})]),
+            directed_graph([], ["C"]),
+            directed_graph([("D", "E")], None, [("E", {"closureSize": 2})]),
+        ]
+
+        result = disjoint_union(graphs)
+
+        self.assertListEqual(result.vs["name"], ["A", "B", "C", "D", "E"])
+
+        # Same as adding graphs one by one.
+        self.assertGraphEqual(result, graphs[0] + graphs[1] + graphs[2])
+        self.assertGraphEqual(
+            result,
+            directed_graph(
+                [("A", "B"), ("D", "E")],
+                ["C"],
+                [("A", {"narSize": 1}), ("E", {"closureSize": 2})]
+            )
+        )
+
+        self.assertGraphEqual(disjoint_union([]), directed_graph([]))
+
+    def test_pack_by_size(self):
+        sizes = {"A": 5, "B": 4, "C": 3, "D": 3, "E": 3, "F": None}
+        graph = directed_graph(
+            [("A", "B"), ("B", "C")],
+            ["D", "E", "F"],
+            [(name, {"narSize": size}) for (name, size) in sizes.items()]
+        )
+        graphs = split_every(1, graph)
+
+        def names(layers):
+            return list(map(vertex_names, layers))
+
+        # Budget is the total size divided by the number of layers.
+        self.assertListEqual(
+            names(pack_by_size(3, None, graphs)),
+            [["A", "F"], ["B", "E"], ["C", "D"]]
+        )
+        self.assertListEqual(
+            [nar_size(layer) for layer in pack_by_size(3, None, graphs)],
+            [5, 7, 6]
+        )
+        self.assertListEqual(
+            names(pack_by_size(2, None, graphs)),
+            [["A", "B", "F"], ["C", "D", "E"]]
+        )
+        self.assertListEqual(
+            names(pack_by_size(1, None, graphs)),
+            [["A", "B", "C", "D", "E", "F"]]
+        )
+        # A layer per graph at most.
+        self.assertListEqual(
+            names(pack_by_size(10, None, graphs)),
+            [["A"], ["B"], ["C"], ["D"], ["E"], ["F"]]
+        )
+        self.assertListEqual(pack_by_size(3, None, []), [])
+
+        # Without sizes, graphs are packed by their count.
+        self.assertListEqual(
+            names(pack_by_size(
+                3,
+                None,
+                split_every(1, directed_graph([], ["A", "B", "C", "D"]))
+            )),
+            [["A", "B"], ["C", "D"]]
+        )
+        self.assertListEqual(
+            names(pack_by_size(
+                4,
+                None,
+                split_every(1, directed_graph([], ["A", "B", "C", "D"]))
+            )),
+            [["A"], ["B"], ["C"], ["D"]]
+        )
+
+        # Given budget. Equally large graphs (C, D and E) are packed in the
+        # given order.
+        self.assertListEqual(
+            names(pack_by_size(10, 8, graphs)),
+            [["A", "C", "F"], ["B", "D"], ["E"]]
+        )
+        # Graphs which don't fit into the budget go to the smallest layer.
+        self.assertListEqual(
+            names(pack_by_size(2, 4, graphs)),
+            [["A", "D", "F"], ["B", "C", "E"]]
+        )
+
+        # Like in a disjoint union, there are no edges between the graphs
+        # merged into a layer.
+        self.assertEqual(pack_by_size(2, None, graphs)[0].ecount(), 0)
+
+        # Layers of graphs without edges are views of the original graph.
+        for layer in pack_by_size(3, None, split_every(1, GraphView(
+            graph,
+            range(graph.vcount()),
+            with_edges=False
+        ))):
+            self.assertIs(layer.graph, graph)
+
+    def test_limit_layers(self):
+        def make_graphs():
+            return [
+                directed_graph([], ["A"]),
+                directed_graph([("B", "C")]),
+                directed_graph([], ["D"], [("D", {"narSize": 1})]),
+            ]
+
+        result = list(limit_layers(2, make_graphs()))
+
+        self.assertEqual(len(result), 2)
+        self.assertGraphEqual(result[0], directed_graph([], ["A"]))
+        self.assertGraphEqual(
+            result[1],
+            directed_graph([("B", "C")], ["D"], [("D", {"narSize": 1})])
+        )
+
+        # Less graphs than the limit.
+        self.assertListEqual(
+            [g.vs["name"] for g in limit_layers(5, make_graphs())],
+            [["A"], ["B", "C"], ["D"]]
+        )
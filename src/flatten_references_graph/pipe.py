@@ -1,16 +1,31 @@
 from toolz import curried as tlz
 from toolz import curry
+import concurrent.futures as futures
+from concurrent.futures.process import BrokenProcessPool
+import functools as functools
+import hashlib as hashlib
+import json as json
 
 from . import lib as lib
 from . import subcomponent as subcomponent
 from .popularity_contest import popularity_contest
 from .split_paths import split_paths
+from .stability import stable_order
 
 from .lib import (
     # references_graph_to_igraph
+    as_graph,
+    as_view,
     debug,
     pick_attrs
 )
+from .graph_view import GraphView, is_graph_or_view, owned_graph
+from .plan import compile_plan
+from .stage_cache import (
+    realize,
+    rebased_to,
+    relative_to
+)
 
 funcs = tlz.merge(
     pick_attrs(
@@ -19,6 +34,7 @@ funcs = tlz.merge(
             "over",
             "split_every",
             "limit_layers",
+            "pack_by_size",
             "remove_paths",
             "reverse"
         ],
@@ -34,11 +50,129 @@ funcs = tlz.merge(
     {
         "split_paths": split_paths,
         "popularity_contest": popularity_contest,
+        "stable_order": stable_order,
         "map": tlz.map
     }
 )
 
 
+def is_paths(x):
+    return isinstance(x, str) or is_list_of_paths(x)
+
+
+def is_list_of_paths(x):
+    return isinstance(x, list) and all(isinstance(path, str) for path in x)
+
+
+def is_layers(x):
+    return isinstance(x, list) and all(map(is_list_of_paths, x))
+
+
+def is_split_path_spec(x):
+    # See split_paths.split_path_spec_to_indices.
+    return isinstance(x, str) or (
+        isinstance(x, dict) and
+        list(x) == ["children_of"] and
+        is_paths(x["children_of"])
+    )
+
+
+def is_split_path_specs(x):
+    return isinstance(x, list) and all(map(is_split_path_spec, x))
+
+
+def is_count(x):
+    return isinstance(x, int) and not isinstance(x, bool) and x > 0
+
+
+def is_key(x):
+    return isinstance(x, str)
+
+
+def is_size_or_none(x):
+    return x is None or is_count(x)
+
+
+# Arguments of every function (apart from the last one, which is the data the
+# stage is applied to), as (description, validator) pairs. Arguments which
+# are stages or pipelines are validated recursively, and pre-applied by
+# preapply_func.
+STAGE = ("stage", None)
+PIPELINE = ("pipeline", None)
+PATHS = ("path or list of paths", is_paths)
+LIST_OF_PATHS = ("list of paths", is_list_of_paths)
+LAYERS = ("list of layers (lists of paths)", is_layers)
+SPLIT_PATH_SPECS = (
+    "list of paths or {\"children_of\": paths} dicts",
+    is_split_path_specs
+)
+COUNT = ("positive integer", is_count)
+SIZE_OR_NONE = ("positive integer (bytes) or null", is_size_or_none)
+KEY = ("key", is_key)
+
+func_args = {
+    "flatten": [],
+    "over": [KEY, STAGE],
+    "split_every": [COUNT],
+    "limit_layers": [COUNT],
+    "pack_by_size": [COUNT, SIZE_OR_NONE],
+    "remove_paths": [PATHS],
+    "reverse": [],
+    "subcomponent_in": [LIST_OF_PATHS],
+    "subcomponent_out": [LIST_OF_PATHS],
+    "split_paths": [SPLIT_PATH_SPECS],
+    "popularity_contest": [],
+    "stable_order": [LAYERS],
+    "map": [STAGE],
+    "pipe": [PIPELINE],
+}
+
+
+def validate_pipeline(pipeline, location="pipeline"):
+    """Raise ValueError if the pipeline is not valid."""
+    if not isinstance(pipeline, list):
+        raise ValueError(f"{location}: expected a list of stages")
+
+    for (index, stage) in enumerate(pipeline):
+        validate_stage(stage, f"{location}[{index}]")
+
+
+def validate_stage(stage, location):
+    if not (
+        isinstance(stage, list) and
+        len(stage) > 0 and
+        isinstance(stage[0], str)
+    ):
+        raise ValueError(f"{location}: expected [function name, *args]")
+
+    [func_name, *args] = stage
+
+    if func_name not in func_args:
+        raise ValueError(f"{location}: unknown function {func_name!r}")
+
+    expected_args = func_args[func_name]
+
+    if len(args) != len(expected_args):
+        raise ValueError(
+            f"{location}: {func_name} expects {len(expected_args)} "
+            f"argument(s), got {len(args)}"
+        )
+
+    for (index, (arg, expected_arg)) in enumerate(zip(args, expected_args)):
+        arg_location = f"{location}[{index + 1}]"
+        (description, is_valid) = expected_arg
+
+        if expected_arg is STAGE:
+            validate_stage(arg, arg_location)
+        elif expected_arg is PIPELINE:
+            validate_pipeline(arg, arg_location)
+        elif not is_valid(arg):
+            raise ValueError(
+                f"{arg_location}: {func_name} expects a {description}, got "
+                f"{arg!r}"
+            )
+
+
 @curry
 def nth_or_none(index, xs):
     try:
@@ -47,33 +181,293 @@ def nth_or_none(index, xs):
         return None
 
 
-def preapply_func(func_call_data):
+def memoised(stage_cache, stage, func):
+    return (
+        func if stage_cache is None
+        else lambda data: stage_cache.get_or_compute(stage, func, data)
+    )
+
+
+def preapply_func(func_call_data, stage_cache=None, executor=None):
+    """Return function applying the stage given by func_call_data.
+
+    If stage_cache (a StageCache) is given, results of the stage (and of all
+    nested stages) are memoised in it. executor is used by nested pipelines
+    (see pipe).
+    """
     [func_name, *args] = func_call_data
     debug("func_name", func_name)
     debug("args", args)
-    debug('func_name in ["over"]', func_name in ["over"])
 
-    # TODO: these could be handled in more generic way by defining, for each
-    # function, which of the args are expected to be functions which need
-    # pre-applying.
-    if func_name == "over":
-        [first_arg, second_arg] = args
-        args = [first_arg, preapply_func(second_arg)]
+    if func_name == "pipe":
+        return memoised(
+            stage_cache,
+            func_call_data,
+            pipe(*args, stage_cache=stage_cache, executor=executor)
+        )
+
+    args = [
+        preapply_func(arg, stage_cache, executor) if expected_arg is STAGE
+        else arg
+        for (arg, expected_arg) in zip(args, func_args[func_name])
+    ]
+
+    return memoised(stage_cache, func_call_data, funcs[func_name](*args))
+
+
+# Parallel evaluation of independent branches of the pipeline (opt-in, by
+# passing an executor to pipe).
+#
+# Consecutive "over" stages with distinct keys, and elements processed by a
+# "map" stage, are independent of each other, so they are submitted to the
+# executor together. Stages nested in such branches run sequentially (in the
+# worker), so that tasks never wait for other tasks of the same executor.
+#
+# With a ThreadPoolExecutor (which helps where igraph releases the GIL),
+# workers run the preapplied functions directly. With a ProcessPoolExecutor,
+# the stage spec and the (materialized) input graph are sent to the worker,
+# along with with_edges and excluded_targets of the input view (so that views
+# in the result have the same edges as when applied sequentially), and views
+# in the result are sent back as positions in the input (see
+# stage_cache.relative_to), so that they are recreated as views of the
+# original base graph. If a worker process dies (e.g. killed when running out
+# of memory), the pool can't be used anymore, so the branches which didn't
+# get their results are applied sequentially instead.
+
+
+def run_stage_on_graph(
+    func_call_data,
+    graph,
+    with_edges=True,
+    excluded_targets=()
+):
+    """Apply the stage to the graph in a worker process, as to a view of it
+    with given with_edges and excluded_targets.
+    """
+    view = GraphView(
+        # Unpickled in the worker, so it's not modified by anyone else.
+        owned_graph(graph),
+        range(graph.vcount()),
+        with_edges,
+        excluded_targets
+    )
+
+    return relative_to(view, realize(preapply_func(func_call_data)(view)))
 
-    elif func_name == "map":
-        args = [preapply_func(args[0])]
 
-    return funcs[func_name](*args)
+def submit_stage(executor, func_call_data, func, data):
+    """Start applying func (preapplied func_call_data) to data. Returns a
+    function which waits for, and returns, the result.
+    """
+    if not isinstance(executor, futures.ProcessPoolExecutor):
+        future = executor.submit(lambda: realize(func(data)))
+        return future.result
+
+    if not is_graph_or_view(data):
+        # Only graphs can be sent to other processes (and the results mapped
+        # back to the original graph).
+        result = func(data)
+        return lambda: result
+
+    def apply_sequentially():
+        debug("process pool is broken, applying sequentially", func_call_data)
+        return func(data)
+
+    view = as_view(data)
+
+    try:
+        position = view.position_by_index()
+        future = executor.submit(
+            run_stage_on_graph,
+            func_call_data,
+            as_graph(view),
+            view.with_edges,
+            [position[index] for index in view.excluded_targets]
+        )
+    except BrokenProcessPool:
+        return apply_sequentially
+
+    def wait():
+        try:
+            return rebased_to(view, future.result())
+        except BrokenProcessPool:
+            return apply_sequentially()
+
+    return wait
+
+
+def parallel_map(executor, func_call_data, stage_cache):
+    func = preapply_func(func_call_data, stage_cache)
+
+    def apply(xs):
+        results = [
+            submit_stage(executor, func_call_data, func, x) for x in xs
+        ]
+        return [result() for result in results]
+
+    return apply
+
+
+def parallel_over(executor, overs, stage_cache):
+    branches = [
+        (key, func_call_data, preapply_func(func_call_data, stage_cache))
+        for [_, key, func_call_data] in overs
+    ]
+
+    def apply(dictionary):
+        results = [
+            (
+                key,
+                submit_stage(executor, func_call_data, func, dictionary[key])
+            )
+            for (key, func_call_data, func) in branches
+        ]
+        return tlz.merge(
+            dictionary,
+            {key: result() for (key, result) in results}
+        )
+
+    return apply
+
+
+def group_overs(pipeline):
+    """Split pipeline into groups of consecutive "over" stages with distinct
+    keys, and single other stages.
+    """
+    groups = []
+
+    for func_call_data in pipeline:
+        if (
+            func_call_data[0] == "over" and
+            len(groups) > 0 and
+            groups[-1][0][0] == "over" and
+            func_call_data[1] not in [over[1] for over in groups[-1]]
+        ):
+            groups[-1].append(func_call_data)
+        else:
+            groups.append([func_call_data])
+
+    return groups
+
+
+def preapply_group(group, stage_cache, executor):
+    [func_call_data, *rest] = group
+
+    if executor is not None and len(rest) > 0:
+        return parallel_over(executor, group, stage_cache)
+
+    if executor is not None and func_call_data[0] == "map":
+        return memoised(
+            stage_cache,
+            func_call_data,
+            parallel_map(executor, func_call_data[1], stage_cache)
+        )
+
+    return preapply_func(func_call_data, stage_cache, executor)
+
+
+def canonical_json(pipeline):
+    return json.dumps(pipeline, sort_keys=True, separators=(",", ":"))
+
+
+class CompiledPipeline:
+    """Validated and compiled (see plan.py) pipeline, which can be applied to
+    any number of graphs.
+
+    digest (and so the hash) depends only on the pipeline spec, so it's the
+    same in every process.
+    """
+
+    def __init__(self, pipeline):
+        validate_pipeline(pipeline)
+
+        self.pipeline = pipeline
+        self.plan = compile_plan(pipeline)
+        self.digest = hashlib.sha256(
+            canonical_json(pipeline).encode("utf-8")
+        ).hexdigest()
+        self.partial_funcs = self.preapply()
+
+    def __repr__(self):
+        return f"CompiledPipeline({self.pipeline!r})"
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, CompiledPipeline) and
+            self.digest == other.digest
+        )
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def preapply(self, stage_cache=None, executor=None):
+        return (
+            [
+                preapply_func(func_call_data, stage_cache)
+                for func_call_data in self.plan
+            ] if executor is None
+            else [
+                preapply_group(group, stage_cache, executor)
+                for group in group_overs(self.plan)
+            ]
+        )
+
+    def __call__(self, data, stage_cache=None, executor=None):
+        """Apply the pipeline to data (see pipe)."""
+        partial_funcs = (
+            self.partial_funcs if stage_cache is None and executor is None
+            else self.preapply(stage_cache, executor)
+        )
+        debug('partial_funcs', partial_funcs)
+
+        return tlz.pipe(
+            data,
+            *partial_funcs
+        )
+
+
+COMPILED_PIPELINES_CACHE_SIZE = 256
+
+
+def compile_pipeline(pipeline):
+    """Return CompiledPipeline for the pipeline (a list of stages, as given
+    in the input). Raises ValueError if the pipeline is not valid.
+
+    Compiled pipelines are cached (least recently used are evicted), so
+    compiling the same pipeline again is cheap.
+    """
+    if isinstance(pipeline, CompiledPipeline):
+        return pipeline
+
+    try:
+        pipeline_json = canonical_json(pipeline)
+    except TypeError as e:
+        raise ValueError(f"pipeline: {e}") from e
+
+    return compile_pipeline_json(pipeline_json)
+
+
+@functools.lru_cache(maxsize=COMPILED_PIPELINES_CACHE_SIZE)
+def compile_pipeline_json(pipeline_json):
+    return CompiledPipeline(json.loads(pipeline_json))
 
 
 @curry
-def pipe(pipeline, data):
+def pipe(pipeline, data, stage_cache=None, executor=None):
+    """Apply pipeline (a list of stages, or a CompiledPipeline) to data.
+
+    If stage_cache (a StageCache) is given, results of stages are memoised
+    in it. If executor (a concurrent.futures Executor) is given, independent
+    branches of the pipeline are evaluated in it concurrently.
+
+    The pipeline is compiled (see compile_pipeline) before it is applied.
+    """
     debug("pipeline", pipeline)
-    partial_funcs = list(tlz.map(preapply_func, pipeline))
-    debug('partial_funcs', partial_funcs)
-    return tlz.pipe(
+
+    return compile_pipeline(pipeline)(
         data,
-        *partial_funcs
+        stage_cache=stage_cache,
+        executor=executor
     )
 
 
@@ -1,10 +1,17 @@
+import os as os
 import unittest
-from .pipe import pipe
+import concurrent.futures as futures
+from concurrent.futures.process import BrokenProcessPool
+from .pipe import compile_pipeline, pipe
+from .graph_view import GraphView, as_view
+from .stage_cache import StageCache
 
 from . import test_helpers as th
 
 from .lib import (
     directed_graph,
+    load_closure_graph,
+    path_relative_to_file
 )
 
 
@@ -151,3 +158,209 @@ class Test(
                 ([], ["A", "B"])
             ]
         )
+
+    def test_stage_cache(self):
+        pipeline = [
+            ["split_paths", ["B"]],
+            [
+                "over",
+                "main",
+                [
+                    "pipe",
+                    [
+                        ["subcomponent_in", ["B"]],
+                        ["over", "rest", ["popularity_contest"]]
+                    ]
+                ]
+            ],
+            ["flatten"],
+            ["map", ["remove_paths", "Root3"]],
+            ["limit_layers", 5],
+        ]
+
+        def run(graph, stage_cache=None):
+            return [
+                (sorted(layer.vs["name"]), sorted(th.edges_as_set(layer)))
+                for layer in pipe(pipeline, graph, stage_cache=stage_cache)
+            ]
+
+        expected = run(make_test_graph())
+
+        stage_cache = StageCache()
+        self.assertListEqual(run(make_test_graph(), stage_cache), expected)
+        self.assertEqual(stage_cache.hits, 0)
+        misses = stage_cache.misses
+
+        # Same graph (but a different igraph instance), every stage with a
+        # graph as input is reused.
+        self.assertListEqual(run(make_test_graph(), stage_cache), expected)
+        self.assertEqual(stage_cache.misses, misses)
+        self.assertGreater(stage_cache.hits, 0)
+
+        # The sub pipeline applied to "main" gets the same input, but the
+        # rest differs.
+        graph = make_test_graph()
+        graph.add_vertex("Root4")
+        hits = stage_cache.hits
+        result = run(graph, stage_cache)
+        self.assertGreater(stage_cache.hits, hits)
+        self.assertListEqual(result[:-1], expected[:-1])
+        self.assertIn("Root4", result[-1][0])
+
+    def test_executor(self):
+        graph = load_closure_graph(path_relative_to_file(
+            __file__,
+            "__test_fixtures/real-references-graph.json"
+        ))
+        roots = [graph.vs[index]["name"] for index in [10, 50, 100, 200]]
+        pipeline = [
+            ["split_paths", roots[:2]],
+            ["over", "main", ["subcomponent_in", roots[2:3]]],
+            ["over", "rest", ["popularity_contest"]],
+            ["over", "main", ["over", "main", ["popularity_contest"]]],
+            ["over", "common", ["split_every", 3]],
+            ["flatten"],
+            ["map", ["remove_paths", roots[3]]],
+            ["map", ["pipe", [["popularity_contest"], ["limit_layers", 2]]]],
+            ["flatten"],
+            ["limit_layers", 40],
+        ]
+
+        def run(**kwargs):
+            return [
+                (layer.vs["name"], sorted(th.edges_as_set(layer)))
+                for layer in pipe(pipeline, graph, **kwargs)
+            ]
+
+        expected = run()
+
+        for executor_class in [
+            futures.ThreadPoolExecutor,
+            futures.ProcessPoolExecutor
+        ]:
+            with executor_class(max_workers=3) as executor:
+                self.assertListEqual(run(executor=executor), expected)
+                self.assertListEqual(
+                    run(executor=executor, stage_cache=StageCache()),
+                    expected
+                )
+
+    def test_executor_view_without_edges(self):
+        graph = make_test_graph()
+        pipeline = [
+            ["split_every", 4],
+            ["map", ["pipe", [["split_every", 2], ["reverse"]]]],
+            ["flatten"]
+        ]
+
+        for view in [
+            GraphView(graph, range(graph.vcount()), with_edges=False),
+            as_view(graph).without_edges_into(
+                graph.vs.select(name_in=["B", "C"]).indices
+            )
+        ]:
+            def run(**kwargs):
+                return [
+                    (layer.vs["name"], sorted(th.edges_as_set(layer)))
+                    for layer in pipe(pipeline, view, **kwargs)
+                ]
+
+            expected = run()
+
+            with futures.ProcessPoolExecutor(max_workers=2) as executor:
+                self.assertListEqual(run(executor=executor), expected)
+
+    def test_broken_process_pool(self):
+        graph = make_test_graph()
+        pipeline = [
+            ["split_paths", ["B"]],
+            ["over", "main", ["popularity_contest"]],
+            ["over", "rest", ["popularity_contest"]],
+            ["flatten"],
+            ["map", ["remove_paths", "F"]]
+        ]
+
+        def run(**kwargs):
+            return [
+                layer.vs["name"] for layer in pipe(pipeline, graph, **kwargs)
+            ]
+
+        expected = run()
+
+        with futures.ProcessPoolExecutor(max_workers=2) as executor:
+            # A worker process dies, which breaks the pool.
+            with self.assertRaises(BrokenProcessPool):
+                executor.submit(os._exit, 1).result()
+
+            self.assertListEqual(run(executor=executor), expected)
+
+    def test_compile_pipeline(self):
+        pipeline = [
+            ["popularity_contest"],
+            ["limit_layers", 3],
+        ]
+        compiled = compile_pipeline(pipeline)
+
+        # Cached by spec.
+        self.assertIs(compile_pipeline([list(s) for s in pipeline]), compiled)
+        self.assertIs(compile_pipeline(compiled), compiled)
+        self.assertEqual(
+            compiled.digest,
+            "91cc1e76c608c2908b6b3fca4542f3d94add86acbd3eb6564487371fb61c9b05"
+        )
+
+        graph = directed_graph([("Root1", "A"), ("A", "B")], ["Root2"])
+
+        for _ in range(2):
+            self.assertListEqual(
+                [layer.vs["name"] for layer in compiled(graph)],
+                [["B"], ["A"], ["Root1", "Root2"]]
+            )
+
+    def test_invalid_pipeline(self):
+        for (pipeline, message) in [
+            ({}, "pipeline: expected a list of stages"),
+            ([["foo"]], "pipeline[0]: unknown function 'foo'"),
+            ([[]], "pipeline[0]: expected [function name, *args]"),
+            (
+                [["limit_layers"]],
+                "pipeline[0]: limit_layers expects 1 argument(s), got 0"
+            ),
+            (
+                [["limit_layers", "3"]],
+                "pipeline[0][1]: limit_layers expects a positive integer, "
+                "got '3'"
+            ),
+            (
+                [["over", "main", ["map", ["subcomponent_in", "A"]]]],
+                "pipeline[0][2][1][1]: subcomponent_in expects a list of "
+                "paths, got 'A'"
+            ),
+            (
+                [["split_paths", ["A", {"parents_of": "B"}]]],
+                "pipeline[0][1]: split_paths expects a list of paths or "
+                "{\"children_of\": paths} dicts"
+            ),
+            (
+                [["map", ["pipe", [["flatten"], "x"]]]],
+                "pipeline[0][1][1][1]: expected [function name, *args]"
+            ),
+            (
+                [["stable_order", ["A"]]],
+                "pipeline[0][1]: stable_order expects a list of layers "
+                "(lists of paths), got ['A']"
+            ),
+            (
+                [["pack_by_size", 3, 0]],
+                "pipeline[0][2]: pack_by_size expects a positive integer "
+                "(bytes) or null, got 0"
+            ),
+            ([["remove_paths", {1}]], "pipeline: "),
+        ]:
+            with self.assertRaises(ValueError) as context:
+                compile_pipeline(pipeline)
+
+            self.assertTrue(
+                str(context.exception).startswith(message),
+                str(context.exception)
+            )
@@ -0,0 +1,83 @@
+# Compilation of pipelines (as given in the input) into plans: equivalent
+# pipelines with fewer stages, applied by pipe.pipe.
+#
+# - stages of nested "pipe" stages are spliced into the pipeline,
+# - adjacent "remove_paths" stages are fused into one, which removes all the
+#   paths in a single pass over vertices of the graph,
+# - adjacent "map" stages are fused into one, which applies both functions to
+#   every element (so the intermediate list is never created),
+# - adjacent "over" stages with the same key are fused into one, applying
+#   both functions to the value.
+#
+# Pipelines given as arguments of "over" and "map" are compiled too.
+# Vertex filtering stages (remove_paths, split_every, split_paths,
+# subcomponent_*) return views of the base graph (see graph_view.py), so
+# igraph graphs are only created by the stages which need edges.
+
+
+def as_list(paths):
+    # remove_paths accepts a single path.
+    return [paths] if isinstance(paths, str) else list(paths)
+
+
+def pipe_stage(pipeline):
+    """Return a single stage equivalent to the pipeline."""
+    plan = compile_plan(pipeline)
+    return plan[0] if len(plan) == 1 else ["pipe", plan]
+
+
+def fuse(first, second):
+    """Return a single stage equivalent to applying first and then second
+    stage, or None if they can't be fused.
+    """
+    [name, *args] = first
+
+    if name != second[0]:
+        return None
+
+    if name == "remove_paths":
+        return ["remove_paths", as_list(args[0]) + as_list(second[1])]
+
+    if name == "map":
+        return ["map", pipe_stage([args[0], second[1]])]
+
+    if name == "over" and args[0] == second[1]:
+        return ["over", args[0], pipe_stage([args[1], second[2]])]
+
+    return None
+
+
+def compile_stage(stage):
+    """Return stages equivalent to the given one, with nested pipelines
+    compiled.
+    """
+    [name, *args] = stage
+
+    if name == "pipe":
+        return compile_plan(args[0])
+
+    if name == "over":
+        return [["over", args[0], pipe_stage([args[1]])]]
+
+    if name == "map":
+        return [["map", pipe_stage([args[0]])]]
+
+    return [stage]
+
+
+def compile_plan(pipeline):
+    """Return a pipeline equivalent to the given one, with adjacent stages
+    fused where possible.
+    """
+    plan = []
+
+    for stage in pipeline:
+        for compiled in compile_stage(stage):
+            fused = None if len(plan) == 0 else fuse(plan[-1], compiled)
+
+            if fused is None:
+                plan.append(compiled)
+            else:
+                plan[-1] = fused
+
+    return plan
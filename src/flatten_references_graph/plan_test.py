@@ -0,0 +1,115 @@
+import unittest
+
+from .lib import (
+    load_closure_graph,
+    path_relative_to_file
+)
+from .pipe import pipe
+from .plan import compile_plan
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class Test(unittest.TestCase):
+
+    def test_fuse_remove_paths(self):
+        self.assertListEqual(
+            compile_plan([
+                ["remove_paths", "A"],
+                ["remove_paths", ["B", "C"]],
+                ["split_every", 2],
+                ["remove_paths", "D"]
+            ]),
+            [
+                ["remove_paths", ["A", "B", "C"]],
+                ["split_every", 2],
+                ["remove_paths", "D"]
+            ]
+        )
+
+    def test_fuse_map(self):
+        self.assertListEqual(
+            compile_plan([
+                ["map", ["remove_paths", "A"]],
+                ["map", ["remove_paths", "B"]],
+                ["map", ["split_every", 1]],
+            ]),
+            [
+                [
+                    "map",
+                    [
+                        "pipe",
+                        [
+                            ["remove_paths", ["A", "B"]],
+                            ["split_every", 1]
+                        ]
+                    ]
+                ]
+            ]
+        )
+
+    def test_fuse_over(self):
+        self.assertListEqual(
+            compile_plan([
+                ["over", "main", ["remove_paths", "A"]],
+                ["over", "main", ["pipe", [["remove_paths", "B"]]]],
+                ["over", "rest", ["popularity_contest"]],
+                ["over", "main", ["popularity_contest"]],
+            ]),
+            [
+                ["over", "main", ["remove_paths", ["A", "B"]]],
+                ["over", "rest", ["popularity_contest"]],
+                ["over", "main", ["popularity_contest"]],
+            ]
+        )
+
+    def test_splice_pipe(self):
+        self.assertListEqual(
+            compile_plan([
+                ["pipe", [["flatten"], ["pipe", [["map", ["flatten"]]]]]],
+                ["map", ["flatten"]],
+                ["pipe", []],
+            ]),
+            [
+                ["flatten"],
+                ["map", ["pipe", [["flatten"], ["flatten"]]]]
+            ]
+        )
+
+    def test_same_result(self):
+        graph = load_closure_graph(path_relative_to_file(
+            __file__,
+            "__test_fixtures/real-references-graph.json"
+        ))
+        [a, b, c, d] = [graph.vs[index]["name"] for index in [10, 50, 100, 3]]
+
+        pipeline = [
+            ["remove_paths", d],
+            ["pipe", [["remove_paths", [c]]]],
+            ["split_paths", [a]],
+            ["over", "main", ["subcomponent_in", [a]]],
+            ["over", "main", ["over", "rest", ["popularity_contest"]]],
+            ["flatten"],
+            ["map", ["remove_paths", b]],
+            ["map", ["popularity_contest"]],
+            ["flatten"],
+            ["limit_layers", 30]
+        ]
+
+        def run(pipeline):
+            return [
+                layer.vs["name"] for layer in pipe(pipeline, graph)
+            ]
+
+        # Applying stages one by one (pipe compiles every one of them
+        # separately).
+        def run_unfused(pipeline):
+            data = graph
+            for stage in pipeline:
+                data = pipe([stage], data)
+            return [layer.vs["name"] for layer in data]
+
+        self.assertLess(len(compile_plan(pipeline)), len(pipeline))
+        self.assertListEqual(run(pipeline), run_unfused(pipeline))
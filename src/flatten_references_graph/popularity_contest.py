@@ -111,16 +111,21 @@
 # they are composed in to an Image.
 
 import igraph as igraph
+import itertools as itertools
 
 from collections import defaultdict
 from operator import eq
 from toolz import curried as tlz
 from toolz import curry
 
+from .bitset import iter_set_bits
+from .graph_view import GraphView
 from .lib import (
+    as_view,
     debug,
     directed_graph,
     igraph_to_reference_graph,
+    is_view,
     over,
     pick_keys,
     reference_graph_node_keys_to_keep
@@ -135,14 +140,21 @@ pick_keys_to_keep = pick_keys(reference_graph_node_keys_to_keep)
 # any other paths
 def find_roots(closures):
     debug('closures', closures)
-    roots = []
+
+    # Collect every path referenced by some other path in a single pass, so
+    # that checking whether a path is a root is a constant time lookup
+    # (instead of calling any_refer_to, which scans all closures, for every
+    # path).
+    referenced = set()
 
     for closure in closures:
         path = closure['path']
-        if not any_refer_to(path, closures):
-            roots.append(path)
+        referenced.update(ref for ref in closure['references'] if ref != path)
 
-    return roots
+    return [
+        closure['path'] for closure in closures
+        if closure['path'] not in referenced
+    ]
 
 
 def any_refer_to(path, closures):
@@ -283,6 +295,131 @@ def graph_popularity_contest(popularity_cache, full_graph):
 
     return popularity
 
+
+# Compute the same popularity as graph_popularity_contest directly from an
+# igraph DAG, without building any of the intermediate trees.
+#
+# Unrolling graph_popularity_contest shows that the popularity of a path is:
+#
+#     popularity(s) = sum(paths_from_roots(u) for u in ancestors_of(s) + [s])
+#
+# where paths_from_roots(u) is the number of distinct paths leading from any
+# root to u (1 for roots). For the example at the top of this file:
+#
+#     paths_from_roots: A:1, B:1, C:1, D:1, E:2, F:3, G:1
+#     popularity(F) = A:1 + B:1 + C:1 + D:1 + E:2 + F:3 = 9
+#
+# paths_from_roots is computed in a pass over the vertices in topological
+# order (Kahn's algorithm), propagating it from parents to children.
+#
+# Sets of ancestors are propagated the same way, stored as ints used as
+# bitsets. A bitset over all vertices takes V / 8 bytes, and in wide graphs
+# (e.g. many roots referencing many shared paths) a large part of the
+# vertices might be waiting for all of their parents to be processed at the
+# same time, which would take O(V^2) memory. So the vertices are split into
+# blocks of POPULARITY_BLOCK_SIZE consecutive vertices in the topological
+# order, and the ancestors are propagated in a separate pass for every block,
+# with bitsets over (positions in) the block only. Popularity of every vertex
+# is the sum of the paths_from_roots of its ancestors in all blocks. The
+# ancestors of a vertex are dropped as soon as the vertex is processed, and
+# vertices preceding the block never have ancestors in it, so are skipped.
+#
+# Memory is therefore O(V * POPULARITY_BLOCK_SIZE / 8 + E), i.e. O(V + E),
+# and all counts are exact (python ints), so the ordering is the same as of
+# graph_popularity_contest.
+#
+# Returns a list of popularities indexed by vertex id, or None if the graph
+# contains a cycle (self references are ignored, like in make_lookup).
+
+POPULARITY_BLOCK_SIZE = 4096
+
+
+def graph_popularity(graph, block_size=POPULARITY_BLOCK_SIZE):
+    return adjacency_popularity(
+        graph.get_adjlist(mode="out"),
+        block_size=block_size
+    )
+
+
+# Same as graph_popularity, for a graph given by successor lists of its
+# vertices (e.g. graph_view.view_adjacency of a view). If wanted (a bytearray
+# of flags by vertex id) is given, popularity is only summed up for the
+# flagged vertices (it's None for the others), which is most of the work.
+def adjacency_popularity(
+    adjacency,
+    wanted=None,
+    block_size=POPULARITY_BLOCK_SIZE
+):
+    vertex_count = len(adjacency)
+
+    # Drop self references and duplicate references.
+    successors = [
+        [child for child in frozenset(children) if child != vertex]
+        for (vertex, children) in enumerate(adjacency)
+    ]
+
+    in_degrees = [0] * vertex_count
+    for children in successors:
+        for child in children:
+            in_degrees[child] += 1
+
+    ready = [
+        vertex for vertex in range(vertex_count) if in_degrees[vertex] == 0
+    ]
+    paths_from_roots = [0] * vertex_count
+    for root in ready:
+        paths_from_roots[root] = 1
+
+    order = []
+
+    while ready:
+        vertex = ready.pop()
+        order.append(vertex)
+
+        for child in successors[vertex]:
+            paths_from_roots[child] += paths_from_roots[vertex]
+            in_degrees[child] -= 1
+            if in_degrees[child] == 0:
+                ready.append(child)
+
+    if len(order) != vertex_count:
+        return None
+
+    popularity = [
+        0 if wanted is None or wanted[vertex] else None
+        for vertex in range(vertex_count)
+    ]
+    ancestors = [0] * vertex_count
+
+    for block_start in range(0, vertex_count, block_size):
+        block_paths_from_roots = [
+            paths_from_roots[vertex]
+            for vertex in order[block_start:block_start + block_size]
+        ]
+
+        for (position, vertex) in enumerate(
+            itertools.islice(order, block_start, None)
+        ):
+            vertex_ancestors = ancestors[vertex]
+            if position < block_size:
+                vertex_ancestors |= 1 << position
+            elif vertex_ancestors == 0:
+                continue
+
+            ancestors[vertex] = 0
+
+            if popularity[vertex] is not None:
+                popularity[vertex] += sum(map(
+                    block_paths_from_roots.__getitem__,
+                    iter_set_bits(vertex_ancestors)
+                ))
+
+            for child in successors[vertex]:
+                ancestors[child] |= vertex_ancestors
+
+    return popularity
+
+
 # Emit a list of packages by popularity, most first:
 #
 # From:
@@ -346,21 +483,91 @@ def popularity_contest(graph):
     #   /nix/store/foo,
     # ]
     #
-    # NOTE: the output is actually a list of igraph graphs with a single vertex
-    # with v["name"] == path, and some properties (defined in
-    # reference_graph_node_keys_to_keep) from the nodes of the input graph
-    # copied as vertex attributes.
+    # NOTE: the output is actually a list of graphs with a single vertex
+    # with v["name"] == path. For igraph input these are views (see
+    # graph_view.py) of the input graph, which share its vertex attributes.
+    # For exportReferencesGraph input these are igraph graphs, with some
+    # properties (defined in reference_graph_node_keys_to_keep) from the
+    # nodes of the input graph copied as vertex attributes.
     debug('graph', graph)
 
-    if isinstance(graph, igraph.Graph):
-        graph = igraph_to_reference_graph(graph)
+    if isinstance(graph, igraph.Graph) or is_view(graph):
+        view = as_view(graph)
 
-    debug("Finding roots")
-    roots = find_roots(graph)
+        return single_vertex_views(
+            view,
+            # Vertex indices of the materialized view correspond to positions
+            # in the view.
+            popularity_contest_indices(view.materialize())
+        )
 
-    debug("Making lookup")
     lookup = make_lookup(graph)
 
+    return map(
+        # Turn each path into a graph with 1 vertex.
+        lambda path: directed_graph(
+            # No edges
+            [],
+            # One vertex, with name=path
+            [path],
+            # Setting desired attributes on the vertex.
+            [(path, pick_keys_to_keep(lookup[path]))]
+        ),
+        order_paths_by_popularity(graph, lookup)
+    )
+
+
+def single_vertex_views(view, positions):
+    """Turn each position into a view of the base graph of view with 1
+    vertex (and no edges), so that no new graphs need to be created.
+    """
+    return map(
+        lambda position: GraphView(
+            view.graph,
+            [view.indices[position]],
+            with_edges=False
+        ),
+        positions
+    )
+
+
+def indices_by_popularity(names, popularity):
+    """Return indices of names (with popularity given by the list of the
+    same length), ordered by popularity (most popular first).
+    """
+    debug("Ordering by popularity")
+    ordered = order_by_popularity(dict(zip(names, popularity)))
+
+    index_by_name = {name: index for (index, name) in enumerate(names)}
+
+    return [index_by_name[path] for path in ordered]
+
+
+def popularity_contest_indices(graph):
+    """Return indices of all vertices of the graph, ordered by popularity
+    (most popular first).
+    """
+    names = graph.vs["name"]
+
+    debug("Computing popularity")
+    popularity = graph_popularity(graph)
+
+    if popularity is None:
+        # Cycles are not supported by graph_popularity, fall back to the
+        # original algorithm.
+        closures = igraph_to_reference_graph(graph)
+        ordered = order_paths_by_popularity(closures, make_lookup(closures))
+        index_by_name = {name: index for (index, name) in enumerate(names)}
+
+        return [index_by_name[path] for path in ordered]
+
+    return indices_by_popularity(names, popularity)
+
+
+def order_paths_by_popularity(closures, lookup):
+    debug("Finding roots")
+    roots = find_roots(closures)
+
     full_graph = {}
     subgraphs_cache = {}
     for root in roots:
@@ -381,23 +588,11 @@ def popularity_contest(graph):
     ordered = order_by_popularity(contest)
 
     debug("Checking for missing paths")
-    missing = []
-
-    for path in all_paths(graph):
-        if path not in ordered:
-            missing.append(path)
+    ordered_set = frozenset(ordered)
+    missing = [
+        path for path in all_paths(closures) if path not in ordered_set
+    ]
 
     ordered.extend(missing)
 
-    return map(
-        # Turn each path into a graph with 1 vertex.
-        lambda path: directed_graph(
-            # No edges
-            [],
-            # One vertex, with name=path
-            [path],
-            # Setting desired attributes on the vertex.
-            [(path, pick_keys_to_keep(lookup[path]))]
-        ),
-        ordered
-    )
+    return ordered
@@ -1,3 +1,6 @@
+import os as os
+import subprocess as subprocess
+import sys as sys
 import unittest
 from toolz import curry
 from toolz import curried as tlz
@@ -8,6 +11,8 @@ from .popularity_contest import (
     all_paths,
     any_refer_to,
     find_roots,
+    adjacency_popularity,
+    graph_popularity,
     graph_popularity_contest,
     make_graph_segment_from_root,
     make_lookup,
@@ -15,10 +20,13 @@ from .popularity_contest import (
     order_by_popularity
 )
 
+from .graph_view import GraphView
 from .lib import (
     directed_graph,
     igraph_to_reference_graph,
-    over
+    load_closure_graph,
+    over,
+    path_relative_to_file
 )
 
 
@@ -26,6 +34,36 @@ if __name__ == "__main__":
     unittest.main()
 
 
+# Computes popularity of a wide DAG with 30k vertices (14,900 roots, each
+# referencing 2 of 14,900 shared paths, each referencing 2 of 200 leaves),
+# and prints by how much (in KiB) the peak RSS of the process grew.
+WIDE_GRAPH_POPULARITY = """
+import resource
+import igraph
+from flatten_references_graph.popularity_contest import graph_popularity
+
+roots = mids = 14900
+leaves = 200
+edges = []
+for i in range(roots):
+    edges.append((i, roots + i))
+    edges.append((i, roots + (i * 7919 + 1) % mids))
+for j in range(mids):
+    edges.append((roots + j, roots + mids + j % leaves))
+    edges.append((roots + j, roots + mids + (j * 31) % leaves))
+graph = igraph.Graph(n=roots + mids + leaves, edges=edges, directed=True)
+
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+graph_popularity(graph)
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before)
+"""
+
+# Bound of the growth of the peak RSS for WIDE_GRAPH_POPULARITY, in KiB
+# (about 9 MiB with POPULARITY_BLOCK_SIZE, over 18 MiB with 4 times larger
+# blocks, or with bitsets over all vertices, i.e. with a single block).
+WIDE_GRAPH_POPULARITY_MAX_RSS_GROWTH = 14 * 1024
+
+
 class CustomAssertions:
     @curry
     def assertResultKeys(self, keys, result):
@@ -109,6 +147,17 @@ class Test(
         test(graph)
         test(igraph_to_reference_graph(graph))
 
+    def test_popularity_contest_igraph_returns_views(self):
+        graph = directed_graph([("A", "B")], ["C"])
+
+        result = list(popularity_contest(graph))
+
+        self.assertListEqual(
+            [(layer.graph, layer.names) for layer in result],
+            [(graph, ["B"]), (graph, ["A"]), (graph, ["C"])]
+        )
+        self.assertTrue(all(isinstance(x, GraphView) for x in result))
+
 
 class TestFindRoots(unittest.TestCase):
     def test_find_roots(self):
@@ -137,6 +186,32 @@ class TestFindRoots(unittest.TestCase):
             ["/nix/store/foo", "/nix/store/hello"]
         )
 
+    def test_find_roots_self_reference(self):
+        # Self references should not prevent a path from being a root, and
+        # roots should be returned in the order of the input closures.
+        self.assertListEqual(
+            find_roots([
+                {
+                    "path": "/nix/store/hello",
+                    "references": [
+                        "/nix/store/hello"
+                    ]
+                },
+                {
+                    "path": "/nix/store/bar",
+                    "references": [
+                        "/nix/store/bar",
+                        "/nix/store/tux"
+                    ]
+                },
+                {
+                    "path": "/nix/store/tux",
+                    "references": []
+                },
+            ]),
+            ["/nix/store/hello", "/nix/store/bar"]
+        )
+
 
 class TestAnyReferTo(unittest.TestCase):
     def test_has_references(self):
@@ -317,6 +392,135 @@ class TestGraphPopularityContest(unittest.TestCase):
         )
 
 
+class TestGraphPopularity(unittest.TestCase):
+    def test_counts_popularity(self):
+        # Graph from the example at the top of popularity_contest.py
+        graph = directed_graph([
+            ("A", "B"),
+            ("A", "G"),
+            ("B", "C"),
+            ("B", "E"),
+            ("C", "D"),
+            ("C", "E"),
+            ("D", "F"),
+            ("E", "F"),
+        ])
+
+        self.assertDictEqual(
+            dict(zip(graph.vs["name"], graph_popularity(graph))),
+            {"A": 1, "B": 2, "C": 3, "D": 4, "E": 5, "F": 9, "G": 2}
+        )
+
+    def test_wanted(self):
+        graph = directed_graph([
+            ("A", "B"),
+            ("A", "G"),
+            ("B", "C"),
+            ("B", "E"),
+            ("C", "D"),
+            ("C", "E"),
+            ("D", "F"),
+            ("E", "F"),
+        ])
+        names = graph.vs["name"]
+
+        self.assertDictEqual(
+            dict(zip(names, adjacency_popularity(
+                graph.get_adjlist(),
+                wanted=bytearray(name in ["E", "F"] for name in names)
+            ))),
+            {
+                "A": None,
+                "B": None,
+                "C": None,
+                "D": None,
+                "E": 5,
+                "F": 9,
+                "G": None
+            }
+        )
+
+    def test_block_size(self):
+        graph = directed_graph([
+            ("A", "B"),
+            ("A", "G"),
+            ("B", "C"),
+            ("B", "E"),
+            ("C", "D"),
+            ("C", "E"),
+            ("D", "F"),
+            ("E", "F"),
+        ])
+        real_graph = load_closure_graph(path_relative_to_file(
+            __file__,
+            "__test_fixtures/real-references-graph.json"
+        ))
+
+        for block_size in [1, 2, 3, 7]:
+            self.assertDictEqual(
+                dict(zip(
+                    graph.vs["name"],
+                    graph_popularity(graph, block_size=block_size)
+                )),
+                {"A": 1, "B": 2, "C": 3, "D": 4, "E": 5, "F": 9, "G": 2}
+            )
+            self.assertListEqual(
+                graph_popularity(real_graph, block_size=block_size),
+                graph_popularity(real_graph)
+            )
+
+    def test_wide_graph_memory(self):
+        process = subprocess.run(
+            [sys.executable, "-c", WIDE_GRAPH_POPULARITY],
+            # Directory containing the package.
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            capture_output=True,
+            text=True,
+            check=True
+        )
+
+        self.assertLess(
+            int(process.stdout),
+            WIDE_GRAPH_POPULARITY_MAX_RSS_GROWTH
+        )
+
+    def test_ignores_self_references_and_duplicates(self):
+        graph = directed_graph([
+            ("A", "A"),
+            ("A", "B"),
+            ("A", "B"),
+        ])
+
+        self.assertDictEqual(
+            dict(zip(graph.vs["name"], graph_popularity(graph))),
+            {"A": 1, "B": 2}
+        )
+
+    def test_cycle(self):
+        graph = directed_graph([
+            ("A", "B"),
+            ("B", "C"),
+            ("C", "B"),
+        ])
+
+        self.assertIsNone(graph_popularity(graph))
+
+    def test_same_order_as_graph_popularity_contest(self):
+        graph = load_closure_graph(path_relative_to_file(
+            __file__,
+            "__test_fixtures/real-references-graph.json"
+        ))
+
+        def result_paths(graph):
+            return [g.vs["name"][0] for g in popularity_contest(graph)]
+
+        self.assertListEqual(
+            result_paths(graph),
+            # Reference graph input uses graph_popularity_contest.
+            result_paths(igraph_to_reference_graph(graph))
+        )
+
+
 class TestOrderByPopularity(unittest.TestCase):
     def test_returns_in_order(self):
         self.assertEqual(
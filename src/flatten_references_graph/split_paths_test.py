@@ -7,9 +7,15 @@ from .split_paths import (
     split_paths
 )
 
+from .popularity_contest import popularity_contest
 from .lib import (
     directed_graph,
-    pick_keys
+    load_json,
+    path_relative_to_file,
+    pick_keys,
+    references_graph_to_igraph,
+    remove_paths,
+    vertex_names
 )
 
 
@@ -182,3 +188,130 @@ class Test(
                 pick_keys(["Root1", "B", "X"], vertex_props_dict).items()
             )
         )
+
+    def test_split_paths_view(self):
+        graph = make_test_graph()
+        view = remove_paths(["Root3", "X"], graph)
+
+        result = self.assertResultKeys(
+            ["main", "common", "rest"],
+            split_paths(["B"], view)
+        )
+
+        # Results are views of the original graph.
+        for value in result.values():
+            self.assertIs(value.graph, graph)
+
+        self.assertGraphEqual(
+            result["main"],
+            directed_graph(
+                [
+                    ("B", "F")
+                ],
+                None,
+                pick_keys(["B"], vertex_props_dict).items()
+            )
+        )
+
+        self.assertGraphEqual(
+            result["rest"],
+            directed_graph(
+                [
+                    ("Root1", "A"),
+                ],
+                ["Root2", "C"],
+                pick_keys(["Root1"], vertex_props_dict).items()
+            )
+        )
+
+        self.assertGraphEqual(
+            result["common"],
+            directed_graph([("D", "E")])
+        )
+
+    def test_split_paths_doesnt_modify_graph(self):
+        graph = make_test_graph()
+        names = graph.vs["name"]
+        edges = [e.tuple for e in graph.es]
+
+        split_paths(["B", {"children_of": "Root3"}], graph)
+
+        self.assertListEqual(graph.vs["name"], names)
+        self.assertListEqual([e.tuple for e in graph.es], edges)
+
+    def test_split_paths_root(self):
+        # Single root.
+        graph = directed_graph([("A", "B"), ("B", "C")])
+        self.assertResultKeys(["main"], split_paths(["A"], graph))
+
+        # One of many roots.
+        graph = directed_graph([("A", "C"), ("B", "C"), ("B", "D")])
+        result = self.assertResultKeys(
+            ["main", "common", "rest"],
+            split_paths(["A"], graph)
+        )
+        self.assertListEqual(result["main"].names, ["A"])
+        self.assertListEqual(result["common"].names, ["C"])
+        self.assertListEqual(result["rest"].names, ["B", "D"])
+
+    def test_split_paths_deletes_edges_into_split_paths(self):
+        graph = directed_graph([
+            ("R", "A"),
+            ("R", "B"),
+            ("A", "B"),
+            ("B", "C"),
+            ("D", "C"),
+            ("R2", "D"),
+            ("R2", "A")
+        ])
+
+        result = self.assertResultKeys(
+            ["main", "common", "rest"],
+            split_paths(["A", "B"], graph)
+        )
+
+        # Edge A -> B points at a split path, so it's not in main.
+        self.assertGraphEqual(result["main"], directed_graph([], ["A", "B"]))
+
+        # Both A and B are roots of main, so A (which comes first) is as
+        # popular as B.
+        self.assertListEqual(
+            list(map(vertex_names, popularity_contest(result["main"]))),
+            [["A"], ["B"]]
+        )
+
+    def test_split_paths_main_popularity_contest(self):
+        nodes = load_json(path_relative_to_file(
+            __file__,
+            "__test_fixtures/real-references-graph.json"
+        ))
+
+        def path(name):
+            [path] = [
+                node["path"] for node in nodes
+                if node["path"].endswith("-" + name)
+            ]
+            return path
+
+        result = split_paths(
+            list(map(path, [
+                "gdk-pixbuf-2.42.2",
+                "glib-2.66.4",
+                "libtiff-4.1.0",
+                "libjpeg-turbo-2.0.6"
+            ])),
+            references_graph_to_igraph(nodes)
+        )
+
+        # Order given by the original implementation (which deleted edges
+        # pointing at split paths, e.g. gdk-pixbuf -> glib, from the graph).
+        self.assertListEqual(
+            list(map(vertex_names, popularity_contest(result["main"]))),
+            [
+                [path("libselinux-3.0")],
+                [path("gdk-pixbuf-2.42.2")],
+                [path("glib-2.66.4")],
+                [path("libjpeg-turbo-2.0.6")],
+                [path("libtiff-4.1.0")]
+            ]
+        )
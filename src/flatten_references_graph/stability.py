@@ -0,0 +1,88 @@
+from toolz import curry
+import igraph as igraph
+
+from .lib import debug, vertex_names
+
+# Ordering of layers which keeps layers of a previous image (e.g. the result
+# for a previous version of the same image) where possible.
+#
+# A layer can be pulled from a registry cache only if it contains exactly the
+# same paths as a layer pulled before. popularity_contest orders paths by
+# popularity, which changes with every change of the graph, so paths can move
+# in and out of the layers which limit_layers keeps separate. stable_order
+# moves the layers which are the same as layers of the previous image to the
+# front (in the previous order), so that they stay separate layers, e.g.
+#
+#   [
+#     ["popularity_contest"],
+#     ["stable_order", <previous layers>],
+#     ["limit_layers", 100]
+#   ]
+#
+# layer_reuse reports how much of a result can be reused.
+
+
+@curry
+def stable_order(previous_layers, layers):
+    """Return layers (graphs) ordered so that the layers with the same paths
+    as any of previous_layers (list of lists of paths) come first, in the
+    order of previous_layers, followed by the other layers in the given
+    order.
+    """
+    previous_position = {}
+    for (position, paths) in enumerate(previous_layers):
+        previous_position.setdefault(frozenset(paths), position)
+
+    kept = []
+    rest = []
+
+    for layer in layers:
+        position = previous_position.get(frozenset(vertex_names(layer)))
+
+        if position is None:
+            rest.append(layer)
+        else:
+            kept.append((position, layer))
+
+    debug("stable_order kept", len(kept), "of", len(kept) + len(rest))
+
+    kept.sort(key=lambda position_and_layer: position_and_layer[0])
+
+    return [layer for (_, layer) in kept] + rest
+
+
+def nar_sizes(references_graph):
+    """Return dict mapping paths of references_graph (result of
+    exportReferencesGraph, or an igraph graph created from it) to their
+    narSize.
+    """
+    if isinstance(references_graph, igraph.Graph):
+        vertices = references_graph.vs
+        # The attribute is missing if no node has narSize.
+        return dict(zip(
+            vertices["name"],
+            vertices["narSize"] if "narSize" in vertices.attributes()
+            else [None] * len(vertices)
+        ))
+
+    return {node["path"]: node.get("narSize") for node in references_graph}
+
+
+def layer_reuse(previous_layers, layers, sizes):
+    """Return counts of layers (lists of paths) which are the same as any of
+    previous_layers, and so can be reused, and of their bytes (sum of sizes
+    of their paths), along with the totals.
+    """
+    previous = frozenset(map(frozenset, previous_layers))
+
+    def layer_size(layer):
+        return sum(sizes.get(path) or 0 for path in layer)
+
+    reused = [layer for layer in layers if frozenset(layer) in previous]
+
+    return {
+        "reused_layers": len(reused),
+        "layers": len(layers),
+        "reused_bytes": sum(map(layer_size, reused)),
+        "bytes": sum(map(layer_size, layers))
+    }
@@ -0,0 +1,83 @@
+import unittest
+
+from .lib import (
+    directed_graph,
+    split_every
+)
+from .stability import (
+    layer_reuse,
+    nar_sizes,
+    stable_order
+)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class Test(unittest.TestCase):
+
+    def test_stable_order(self):
+        graph = directed_graph([("A", "B"), ("B", "C")], ["D", "E"])
+        layers = split_every(1, graph)
+
+        result = stable_order([["D"], ["X"], ["B"], ["A", "C"]], layers)
+
+        self.assertListEqual(
+            [layer.names for layer in result],
+            [["D"], ["B"], ["A"], ["C"], ["E"]]
+        )
+        # Layers are not copied.
+        self.assertTrue(all(layer in layers for layer in result))
+
+        self.assertListEqual(
+            [layer.names for layer in stable_order([], layers)],
+            [layer.names for layer in layers]
+        )
+
+    def test_stable_order_multi_path_layers(self):
+        graph = directed_graph([("A", "B"), ("B", "C")], ["D"])
+
+        self.assertListEqual(
+            [
+                layer.names for layer in
+                stable_order([["D", "C"], ["B"]], split_every(2, graph))
+            ],
+            [["C", "D"], ["A", "B"]]
+        )
+
+    def test_layer_reuse(self):
+        sizes = {"A": 1, "B": 2, "C": 4, "D": None}
+
+        self.assertDictEqual(
+            layer_reuse(
+                [["A"], ["C", "B"], ["D"]],
+                [["A"], ["B", "C"], ["D", "A"]],
+                sizes
+            ),
+            {
+                "reused_layers": 2,
+                "layers": 3,
+                "reused_bytes": 7,
+                "bytes": 8
+            }
+        )
+
+    def test_nar_sizes(self):
+        nodes = [
+            {"path": "A", "narSize": 1, "references": ["B"]},
+            {"path": "B", "narSize": 2, "references": []}
+        ]
+
+        self.assertDictEqual(nar_sizes(nodes), {"A": 1, "B": 2})
+
+        graph = directed_graph(
+            [("A", "B")],
+            None,
+            [("A", {"narSize": 1}), ("B", {"narSize": 2})]
+        )
+        self.assertDictEqual(nar_sizes(graph), {"A": 1, "B": 2})
+        self.assertDictEqual(
+            nar_sizes(directed_graph([("A", "B")])),
+            {"A": None, "B": None}
+        )
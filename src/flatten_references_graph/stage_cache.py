@@ -0,0 +1,199 @@
+import collections as collections
+import collections.abc
+import hashlib as hashlib
+import json as json
+import threading as threading
+
+from .graph_view import (
+    GraphView,
+    as_view,
+    is_graph_or_view,
+    is_view,
+    view_edges
+)
+
+# Memoisation of results of pipeline stages (see pipe.pipe).
+#
+# Results are keyed by the stage spec (as given in the pipeline) and by a
+# structural fingerprint of the stage input: vertex names and attributes (in
+# the order of vertices) and edges between the vertices. Graphs with the same
+# fingerprint are indistinguishable for the stages, so the result computed
+# for one of them can be reused for the other, even if they are views of
+# different base graphs (e.g. the same sub pipeline applied to the same
+# subgraph of graphs of multiple images).
+#
+# Only stages with a single graph (or view) as input are memoised. Their
+# results are views of the input (or new graphs), so the views are stored
+# relative to the input (as positions in the input view) and recreated for
+# the input of each cache hit.
+
+DEFAULT_MAX_ENTRIES = 1024
+
+
+class Positions:
+    """Stored form of a result view: positions of its vertices (and of its
+    excluded_targets) in the input view of the stage.
+    """
+
+    __slots__ = ("positions", "with_edges", "excluded_targets")
+
+    def __init__(self, positions, with_edges, excluded_targets=()):
+        self.positions = positions
+        self.with_edges = with_edges
+        self.excluded_targets = excluded_targets
+
+
+class NotRelative(Exception):
+    pass
+
+
+def fingerprint(graph_or_view):
+    view = as_view(graph_or_view)
+    graph = view.graph
+    vertices = graph.vs.select(view.indices)
+
+    hasher = hashlib.sha256(json.dumps(
+        [
+            {
+                name: vertices[name]
+                for name in sorted(graph.vs.attributes())
+            },
+            # Edges between the vertices of the base graph are included even
+            # if the view has no edges, as views of the result might have.
+            sorted(view_edges(view)),
+            view.with_edges
+        ],
+        separators=(",", ":"),
+        default=repr
+    ).encode("utf-8"))
+
+    return hasher.hexdigest()
+
+
+def realize(data):
+    """Turn all (possibly nested) iterators in data into lists, so that the
+    data can be stored and used more than once.
+    """
+    if isinstance(data, dict):
+        return {key: realize(value) for (key, value) in data.items()}
+
+    if isinstance(data, (list, tuple, collections.abc.Iterator)):
+        return [realize(x) for x in data]
+
+    return data
+
+
+def relative_to(view, data):
+    """Replace views of data with Positions in the view.
+
+    Raises NotRelative if data contains a view of the base graph of the view
+    with vertices not in the view.
+    """
+    position = None
+
+    def relative(data):
+        nonlocal position
+
+        if isinstance(data, dict):
+            return {key: relative(value) for (key, value) in data.items()}
+
+        if isinstance(data, list):
+            return [relative(x) for x in data]
+
+        if is_view(data) and data.graph is view.graph:
+            if position is None:
+                position = {
+                    index: position
+                    for (position, index) in enumerate(view.indices)
+                }
+
+            try:
+                positions = [position[index] for index in data.indices]
+            except KeyError:
+                raise NotRelative()
+
+            return Positions(
+                positions,
+                data.with_edges,
+                [position[index] for index in data.excluded_targets]
+            )
+
+        return data
+
+    return relative(data)
+
+
+def rebased_to(view, data):
+    """Inverse of relative_to."""
+    if isinstance(data, dict):
+        return {key: rebased_to(view, value) for (key, value) in data.items()}
+
+    if isinstance(data, list):
+        return [rebased_to(view, x) for x in data]
+
+    if isinstance(data, Positions):
+        indices = view.indices
+        return GraphView(
+            view.graph,
+            (indices[position] for position in data.positions),
+            data.with_edges,
+            [indices[position] for position in data.excluded_targets]
+        )
+
+    return data
+
+
+class StageCache:
+    """Bounded (least recently used entries are evicted) cache of results of
+    pipeline stages. Can be used by many threads (see pipe.pipe).
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get_or_compute(self, stage, func, data):
+        """Return func(data), or the result of the same stage for data with
+        the same fingerprint computed previously.
+
+        Nested iterators in the result are turned into lists.
+        """
+        if not is_graph_or_view(data):
+            return func(data)
+
+        view = as_view(data)
+        key = (
+            json.dumps(stage, sort_keys=True, separators=(",", ":")),
+            fingerprint(view)
+        )
+
+        with self.lock:
+            stored = self.entries.get(key)
+            if stored is not None:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            else:
+                self.misses += 1
+
+        if stored is not None:
+            return rebased_to(view, stored)
+
+        result = realize(func(data))
+
+        try:
+            stored = relative_to(view, result)
+        except NotRelative:
+            return result
+
+        with self.lock:
+            self.entries[key] = stored
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        return result
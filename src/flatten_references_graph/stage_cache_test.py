@@ -0,0 +1,141 @@
+import unittest
+
+from .graph_view import GraphView, view_adjacency
+
+from .lib import (
+    directed_graph,
+    split_every
+)
+
+from .split_paths import split_paths
+from .stage_cache import (
+    StageCache,
+    fingerprint
+)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+def make_test_graph(extra_edges=[]):
+    return directed_graph(
+        [
+            ("A", "B"),
+            ("B", "C"),
+            ("C", "D"),
+            *extra_edges
+        ],
+        None,
+        [("A", {"narSize": 1})]
+    )
+
+
+def view_of(graph, names):
+    return GraphView(graph, [graph.vs.find(name).index for name in names])
+
+
+class Test(unittest.TestCase):
+
+    def test_fingerprint(self):
+        graph = make_test_graph()
+
+        self.assertEqual(
+            fingerprint(graph),
+            fingerprint(make_test_graph())
+        )
+        self.assertEqual(
+            fingerprint(view_of(graph, ["B", "C"])),
+            fingerprint(view_of(make_test_graph([("D", "A")]), ["B", "C"]))
+        )
+        # Order of vertices matters.
+        self.assertNotEqual(
+            fingerprint(view_of(graph, ["B", "C"])),
+            fingerprint(view_of(graph, ["C", "B"]))
+        )
+        # Edges matter.
+        self.assertNotEqual(
+            fingerprint(view_of(graph, ["A", "C"])),
+            fingerprint(view_of(make_test_graph([("A", "C")]), ["A", "C"]))
+        )
+        # Attributes matter.
+        self.assertNotEqual(
+            fingerprint(view_of(graph, ["A"])),
+            fingerprint(view_of(directed_graph([], ["A"]), ["A"]))
+        )
+
+    def test_get_or_compute(self):
+        stage_cache = StageCache()
+        stage = ["split_every", 2]
+        calls = []
+
+        def func(data):
+            calls.append(data)
+            return iter(split_every(2, data))
+
+        view = view_of(make_test_graph(), ["D", "C", "B"])
+        result = stage_cache.get_or_compute(stage, func, view)
+
+        self.assertListEqual(
+            [layer.names for layer in result],
+            [["D", "C"], ["B"]]
+        )
+
+        other_view = view_of(make_test_graph([("A", "D")]), ["D", "C", "B"])
+        other_result = stage_cache.get_or_compute(stage, func, other_view)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((stage_cache.hits, stage_cache.misses), (1, 1))
+        self.assertListEqual(
+            [layer.names for layer in other_result],
+            [["D", "C"], ["B"]]
+        )
+        # Result is a view of the graph of the given input.
+        self.assertIs(other_result[0].graph, other_view.graph)
+
+        # Different stage spec.
+        stage_cache.get_or_compute(["split_every", 1], func, view)
+        self.assertEqual(len(calls), 2)
+
+    def test_get_or_compute_without_edges_into(self):
+        stage_cache = StageCache()
+        stage = ["split_paths", ["A", "B"]]
+
+        def func(data):
+            return split_paths(["A", "B"], data)
+
+        for _ in range(2):
+            result = stage_cache.get_or_compute(
+                stage,
+                func,
+                make_test_graph([("E", "C")])
+            )
+
+        self.assertEqual(stage_cache.hits, 1)
+        # The edge A -> B points at a split path, and is not in the result
+        # recreated from the cache either.
+        self.assertListEqual(result["main"].names, ["A", "B"])
+        self.assertListEqual(view_adjacency(result["main"]), [[], []])
+
+    def test_not_graph(self):
+        stage_cache = StageCache()
+
+        self.assertEqual(
+            stage_cache.get_or_compute(["x"], len, [1, 2]),
+            2
+        )
+        self.assertEqual(len(stage_cache), 0)
+
+    def test_max_entries(self):
+        stage_cache = StageCache(max_entries=2)
+        graph = make_test_graph()
+
+        for stage in [["a"], ["b"], ["c"], ["a"]]:
+            stage_cache.get_or_compute(stage, graph_vcount, graph)
+
+        self.assertEqual(len(stage_cache), 2)
+        self.assertEqual((stage_cache.hits, stage_cache.misses), (0, 4))
+
+
+def graph_vcount(graph):
+    return graph.vcount()
@@ -1,32 +1,32 @@
 from toolz import curry
-from toolz import curried as tlz
-from operator import attrgetter
 
 from .lib import (
+    as_view,
     debug,
-    find_vertex_by_name_or_none,
-    is_None,
+    find_many,
     subcomponent_multi
 )
 
 
 @curry
 def subcomponent(mode, paths, graph):
-    path_indices = tlz.compose(
-        tlz.map(attrgetter('index')),
-        tlz.remove(is_None),
-        tlz.map(find_vertex_by_name_or_none(graph))
-    )(paths)
+    view = as_view(graph)
+    # All vertices are identified by their positions in the view.
+    path_indices = find_many(view, paths)
 
     debug("path_indices", path_indices)
 
-    main_indices = list(subcomponent_multi(graph, path_indices, mode))
+    main_indices = subcomponent_multi(view, path_indices, mode)
 
     debug('main_indices', main_indices)
 
+    is_main = frozenset(main_indices)
+
     return {
-        "main": graph.induced_subgraph(main_indices),
-        "rest": graph - main_indices
+        "main": view.select(main_indices),
+        "rest": view.select(
+            i for i in range(view.vcount()) if i not in is_main
+        )
     }
 
 
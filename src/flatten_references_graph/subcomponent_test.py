@@ -217,3 +217,27 @@ class Test(
                 pick_keys(["X"], vertex_props_dict).items()
             )
         )
+
+    def test_subcomponent_of_view(self):
+        graph = make_test_graph()
+
+        rest = subcomponent_in(["D"], graph)["rest"]
+        result = self.assertResultKeys(subcomponent_out(["C"], rest))
+
+        # Results are views of the original graph.
+        self.assertIs(result["main"].graph, graph)
+        self.assertIs(result["rest"].graph, graph)
+
+        self.assertGraphEqual(
+            result["main"],
+            directed_graph([], ["C"])
+        )
+
+        self.assertGraphEqual(
+            result["rest"],
+            directed_graph(
+                [],
+                ["E", "Root3", "X"],
+                pick_keys(["X"], vertex_props_dict).items()
+            )
+        )
@@ -0,0 +1,19 @@
+import json as json
+import os as os
+import sys as sys
+
+# Helpers which don't depend on igraph or toolz, so that they can be used by
+# the entry point (see __main__.py) before (or without) importing them.
+
+DEBUG = os.environ.get("DEBUG", False) == "True"
+DEBUG_PLOT = os.environ.get("DEBUG_PLOT", False) == "True"
+
+
+def debug(*args, **kwargs):
+    if DEBUG:
+        print(*args, file=sys.stderr, **kwargs)
+
+
+def load_json(file_path):
+    with open(file_path) as f:
+        return json.load(f)